@@ -0,0 +1,274 @@
+"""Benchmark suite for the grid, physics and drawing hot paths, with a saved baseline.
+
+Every case runs on seeded board fixtures at several fill levels, for both
+Grid and BitboardGrid where the operation differs, and reports the best
+time per operation over several repeats. --save writes the results to a
+baseline JSON file; --compare reads one back and flags every case that got
+slower by more than --threshold, exiting non-zero if any did.
+
+    python benchmarks/bench_core.py [--save FILE] [--compare FILE] [--threshold 0.15] [--filter TEXT] [--quick]
+
+Timings depend on the machine, so only compare against a baseline saved on
+the same one. The default baseline path, benchmarks/baseline.json, is not
+tracked.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bubble_shot as bs  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+FILL_LEVELS = (0.25, 0.5, 0.9)
+GRID_CLASSES = (bs.Grid, bs.BitboardGrid)
+SHOT_ANGLES = [bs.MIN_ANGLE + (bs.MAX_ANGLE - bs.MIN_ANGLE) * (i + 0.5) / 8 for i in range(8)]
+
+
+def board(grid_class, fill, seed=0):
+    """A seeded board with about `fill` of its cells occupied, all anchored to the ceiling.
+
+    Rows are filled from the top down to the fill level, with one cell in
+    ten left empty; anything the holes cut off is dropped.
+    """
+    rng = random.Random(seed)
+    grid = grid_class(initial_rows=0, rng=rng)
+    target = int(fill * grid.cols * grid.rows)
+    placed = 0
+    for r in range(grid.rows - 1):
+        for c in range(grid.cols):
+            if placed < target and rng.random() >= 0.1:
+                grid.place_bubble(c, r, rng.randrange(len(bs.COLORS)))
+                placed += 1
+    grid.remove_floating_groups()
+    grid.unverified.clear()
+    grid.dirty_cells.clear()
+    return grid
+
+
+def occupied(grid):
+    return [(c, r) for r in range(grid.rows) for c, ci in enumerate(grid.row(r)) if ci is not None]
+
+
+def measure(fn, setup=None, number=100, repeat=5):
+    """Best seconds per call of fn(state) over `repeat` runs of `number` calls.
+
+    With `setup`, every call gets a fresh state from setup(), built outside
+    the timed region; otherwise fn is passed None.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is None:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn(None)
+            elapsed = time.perf_counter() - start
+        else:
+            elapsed = 0.0
+            for _ in range(number):
+                state = setup()
+                start = time.perf_counter()
+                fn(state)
+                elapsed += time.perf_counter() - start
+        best = min(best, elapsed / number)
+    return best
+
+
+def lookup_cases(rng):
+    points = [(rng.uniform(0, bs.SCREEN_WIDTH), rng.uniform(bs.GRID_TOP, bs.SHOOTER_Y)) for _ in range(200)]
+    for fn in (bs.pixel_to_grid_bruteforce, bs.pixel_to_grid_fast, bs.pixel_to_grid):
+        yield fn.__name__, lambda _, fn=fn: [fn(x, y) for x, y in points], None, len(points)
+
+
+def grid_cases(rng):
+    planner = bs.ShotPlanner()
+    for grid_class in GRID_CLASSES:
+        name = grid_class.__name__
+        for fill in FILL_LEVELS:
+            grid = board(grid_class, fill)
+            cells = occupied(grid)
+
+            def tag(op, name=name, fill=fill):
+                return "%s[%s,fill=%.2f]" % (op, name, fill)
+
+            yield (tag("flood_fill_group"),
+                   lambda _, g=grid, cells=cells: [g.flood_fill_group(c, r) for c, r in cells], None, len(cells))
+
+            # Nothing floats on the fixture, so these passes check the whole board and remove nothing.
+            yield tag("remove_floating_groups"), lambda _, g=grid: g.remove_floating_groups(), None, 1
+            if grid_class is bs.Grid:
+                removed = cells[-3:]
+                yield (tag("remove_floating_groups_near"),
+                       lambda _, g=grid, removed=removed: g.remove_floating_groups(removed), None, 1)
+
+            # Contact points of real shots, placed and taken back out again.
+            session = bs.GameSession(grid_class=grid_class, seed=0)
+            session.grid = grid
+            bubbles = []
+            for angle in SHOT_ANGLES:
+                x, y = session.trace(angle).contact
+                bubbles.append(bs.Bubble(x, y, rng.randrange(len(bs.COLORS))))
+
+            def place(_, g=grid, bubbles=bubbles):
+                for b in bubbles:
+                    g.remove_cells([g.place_bubble_at_pixel(b)])
+            yield tag("place_bubble_at_pixel+remove"), place, None, len(bubbles)
+
+            yield (tag("add_row_top"),
+                   lambda g: g.add_row_top(1), lambda gc=grid_class, f=fill: board(gc, f), 1)
+
+            yield tag("trace_shot"), lambda _, s=session: [s.trace(a) for a in SHOT_ANGLES], None, len(SHOT_ANGLES)
+
+            def fresh_session(gc=grid_class, f=fill):
+                s = bs.GameSession(grid_class=gc, seed=1)
+                s.grid = board(gc, f, seed=1)
+                s.shots_remaining = s.shots_allowed = len(SHOT_ANGLES)
+                return s
+
+            yield (tag("play_shot"),
+                   lambda s: [s.play_shot(a) for a in SHOT_ANGLES], fresh_session, len(SHOT_ANGLES))
+
+            def shot_played(gc=grid_class, f=fill):
+                s = fresh_session(gc, f)
+                s.credits = bs.UNDO_COST
+                s.play_shot(SHOT_ANGLES[3])
+                return s
+
+            yield tag("undo_shot"), lambda s: s.undo_shot(), shot_played, 1
+
+            yield tag("ShotPlanner.evaluate"), lambda _, s=session: planner.evaluate(s), None, 1
+
+
+def particles(count, rng, vectorized=True):
+    """A ParticleSystem of `count` bubbles scattered over the screen, drifting too slowly to be culled."""
+    system = bs.ParticleSystem(gravity=0.0, vectorized=vectorized)
+    system.spawn([rng.uniform(0, bs.SCREEN_WIDTH) for _ in range(count)],
+                 [rng.uniform(bs.GRID_TOP, bs.SHOOTER_Y) for _ in range(count)],
+                 [rng.uniform(-1, 1) for _ in range(count)], [0.0] * count,
+                 [rng.randrange(len(bs.COLORS)) for _ in range(count)])
+    return system
+
+
+def particle_cases(rng):
+    for vectorized in (True, False):
+        if vectorized and bs.np is None:
+            continue
+        name = "numpy" if vectorized else "array"
+        for count in (100, 1000):
+            system = particles(count, rng, vectorized)
+            yield ("ParticleSystem.update[%s,n=%d]" % (name, count),
+                   lambda _, p=system: p.update(1 / 120), None, 1)
+
+
+def analysis_cases(rng):
+    if bs.np is None:
+        return
+    grids = [board(bs.Grid, FILL_LEVELS[i % len(FILL_LEVELS)], seed=i) for i in range(1000)]
+    arrays = bs.np.stack([bs.board_array(g) for g in grids])
+
+    def flood_fill_all(_, grids=grids[:100]):
+        for g in grids:
+            seen = set()
+            for c, r in occupied(g):
+                if (c, r) not in seen:
+                    seen.update(g.flood_fill_group(c, r))
+    yield "flood_fill_group[every group,per board]", flood_fill_all, None, 100
+    yield "analyze_boards[Grid,per board]", lambda _, g=grids[:100]: bs.analyze_boards(g), None, 100
+    yield "analyze_boards[array,per board]", lambda _, a=arrays: bs.analyze_boards(a), None, len(arrays)
+
+
+def draw_cases(rng):
+    try:
+        import pygame
+    except ImportError:
+        return
+    pygame.display.init()
+    pygame.display.set_mode((bs.SCREEN_WIDTH, bs.SCREEN_HEIGHT))
+    surf = pygame.Surface((bs.SCREEN_WIDTH, bs.SCREEN_HEIGHT))
+    atlas = bs.BubbleAtlas()
+    for fill in FILL_LEVELS:
+        grid = board(bs.Grid, fill)
+        yield "Grid.draw[primitives,fill=%.2f]" % fill, lambda _, g=grid: g.draw(surf), None, 1
+        yield "Grid.draw[atlas,fill=%.2f]" % fill, lambda _, g=grid: g.draw(surf, atlas), None, 1
+    system = particles(200, rng)
+    yield "ParticleSystem.draw[atlas,n=200]", lambda _: system.draw(surf, atlas), None, 1
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    scale = 0.2 if args.quick else 1.0
+    results = {}
+    for cases in (lookup_cases, grid_cases, particle_cases, analysis_cases, draw_cases):
+        for name, fn, setup, ops in cases(rng):
+            if args.filter and args.filter not in name:
+                continue
+            # Aim for roughly 20 ms per repeat, whatever the cost of one call.
+            once = measure(fn, setup, number=1, repeat=1)
+            number = max(1, int(0.02 * scale / max(once, 1e-9)))
+            if setup is not None:
+                number = min(number, 200)
+            results[name] = measure(fn, setup, number=number, repeat=args.repeat) / ops
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", metavar="FILE", nargs="?", const=DEFAULT_BASELINE,
+                        help="write results as a baseline (default file: %(const)s)")
+    parser.add_argument("--compare", metavar="FILE", nargs="?", const=DEFAULT_BASELINE,
+                        help="flag regressions against a saved baseline (default file: %(const)s)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown that counts as a regression (default: %(default)s)")
+    parser.add_argument("--filter", metavar="TEXT", help="only run cases whose name contains TEXT")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="shorter runs, for a smoke check")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = run(args)
+    regressions = []
+    print(f"{'case':<58} {'us/op':>10} {'baseline':>10} {'ratio':>7}")
+    for name, secs in results.items():
+        line = f"{name:<58} {secs * 1e6:10.3f}"
+        if baseline is not None and name in baseline:
+            ratio = secs / baseline[name]
+            line += f" {baseline[name] * 1e6:10.3f} {ratio:7.2f}"
+            if ratio > 1 + args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        tmp = args.save + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=2)
+        os.replace(tmp, args.save)
+        print(f"saved baseline to {args.save}")
+    if baseline is not None:
+        missing = sorted(set(baseline) - set(results)) if not args.filter else []
+        for name in missing:
+            print(f"not run: {name}")
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""CPU use of a game left alone, with idle mode and with the fixed-rate loop (--no-idle).
+
+Each case starts `bubble_shot.py play` twice, runs it for a short and a
+long time without input and stops it with SIGTERM (which SDL turns into a
+quit event). The difference in the child's CPU time over the difference
+in wall time is the idle cost, without startup. With --budget PERCENT,
+exits non-zero if idle mode uses more than that share of one core.
+
+    python benchmarks/bench_idle.py [--seconds 10] [--budget PERCENT]
+
+The dummy SDL video driver, used unless SDL_VIDEODRIVER is set, cannot
+block in pygame.event.wait(), so SDL polls the queue every millisecond;
+real video drivers sleep until an event arrives, and use less than this.
+"""
+import argparse
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bubble_shot.py")
+SHORT = 2.0
+
+
+def cpu_seconds(args, secs, env):
+    """CPU time (user + system) a game run for `secs` of wall time used."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    proc = subprocess.Popen([sys.executable, SCRIPT, "play", "--seed", "1"] + args, env=env)
+    time.sleep(secs)
+    proc.send_signal(signal.SIGTERM)
+    if proc.wait() != 0:
+        raise RuntimeError("game exited with status %d" % proc.returncode)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="idle time measured per case")
+    parser.add_argument("--budget", type=float, metavar="PERCENT", help="fail if idle mode uses more CPU than this")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+    usage = {}
+    for label, extra in (("idle mode", []), ("fixed rate (--no-idle)", ["--no-idle"])):
+        short = cpu_seconds(extra, SHORT, env)
+        long = cpu_seconds(extra, SHORT + args.seconds, env)
+        usage[label] = max(0.0, long - short) / args.seconds * 100
+        print(f"{label:<24} {usage[label]:6.1f} % of a core")
+    if args.budget is not None and usage["idle mode"] > args.budget:
+        print(f"idle mode is over the {args.budget:g} % budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
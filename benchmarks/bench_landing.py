@@ -0,0 +1,116 @@
+"""Landing-cell resolution: the hex-neighbour resolver against the old square scan.
+
+Real shots are traced at evenly spaced angles on seeded boards at several
+fill levels, down to a nearly empty one where many shots reach the
+ceiling, and every contact point is resolved by both
+Grid.landing_cell() (with the bubble hit) and Grid.legacy_landing_cell().
+For each rule the script counts landings that do not touch the bubble hit
+(or the ceiling) although it had an empty neighbour, and landings whose
+bubble would drop straight away, and times both. It exits non-zero if the
+current rule ever produces either, or an occupied cell.
+
+    python benchmarks/bench_landing.py [--angles 200] [--seeds 5] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bubble_shot as bs  # noqa: E402
+from bench_core import FILL_LEVELS, board  # noqa: E402
+
+
+def contacts(grid, angles):
+    """(x, y, hit_cell) where each of `angles` stops on `grid`."""
+    session = bs.GameSession(seed=0, undo=False)
+    session.grid = grid
+    out = []
+    for i in range(angles):
+        path = session.trace(bs.MIN_ANGLE + (bs.MAX_ANGLE - bs.MIN_ANGLE) * (i + 0.5) / angles)
+        x, y = path.contact
+        out.append((x, y, path.hit_cell))
+    return out
+
+
+def resolve_new(grid, x, y, hit):
+    return grid.landing_cell(x, y, hit) if hit is not None else grid.ceiling_cell(x, y)
+
+
+def resolve_old(grid, x, y, hit):
+    return grid.legacy_landing_cell(x, y)
+
+
+def faults(grid, cell, hit, x):
+    """(detached, drops) for a bubble landing in `cell` after stopping at `x` on `hit` (None: the ceiling).
+
+    A shot passing beside the board can stop on a bubble with no empty
+    neighbour, or on the ceiling above a full top row. Landing elsewhere is
+    not counted as detached then.
+    """
+    c, r = cell
+    if hit is None:
+        layout = grid.layout
+        above = min(max(round((x - layout.x0) / layout.diam), 0), grid.cols - 1)
+        detached = r != 0 and grid.get(above, 0) is None
+    else:
+        neighbors = grid.neighbors(*hit)
+        detached = cell not in neighbors and any(grid.get(nc, nr) is None for nc, nr in neighbors)
+    fork = grid.fork()
+    fork.place_bubble(c, r, 0)
+    drops = fork.remove_floating_groups() > 0
+    return detached, drops
+
+
+def best_time(fn, points, grid, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for x, y, hit in points:
+            fn(grid, x, y, hit)
+        best = min(best, time.perf_counter() - start)
+    return best / len(points)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--angles", type=int, default=200, help="shots traced per board")
+    parser.add_argument("--seeds", type=int, default=5, help="boards per fill level")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'board':<22} {'rule':<7} {'shots':>6} {'differ':>7} {'detached':>9} {'drops':>6} {'us/call':>8}")
+    for grid_class in (bs.Grid, bs.BitboardGrid):
+        for fill in (0.05,) + FILL_LEVELS:
+            stats = {"new": [0, 0, 0.0], "legacy": [0, 0, 0.0]}
+            shots = differ = 0
+            for seed in range(args.seeds):
+                grid = board(grid_class, fill, seed)
+                points = contacts(grid, args.angles)
+                shots += len(points)
+                for x, y, hit in points:
+                    new = resolve_new(grid, x, y, hit)
+                    old = resolve_old(grid, x, y, hit)
+                    differ += new != old
+                    if grid.get(*new) is not None:
+                        failures += 1
+                    for rule, cell in (("new", new), ("legacy", old)):
+                        detached, drops = faults(grid, cell, hit, x)
+                        stats[rule][0] += detached
+                        stats[rule][1] += drops
+                for rule, fn in (("new", resolve_new), ("legacy", resolve_old)):
+                    stats[rule][2] += best_time(fn, points, grid, args.repeat) / args.seeds
+            failures += stats["new"][0] + stats["new"][1]
+            name = "%s,fill=%.2f" % (grid_class.__name__, fill)
+            for rule in ("new", "legacy"):
+                detached, drops, secs = stats[rule]
+                print(f"{name:<22} {rule:<7} {shots:6d} {differ:7d} {detached:9d} {drops:6d} {secs * 1e6:8.2f}")
+    print("%d fault(s) from the current rule" % failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
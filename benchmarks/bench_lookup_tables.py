@@ -0,0 +1,95 @@
+"""Micro-benchmark for the precomputed cell-center and neighbor tables.
+
+Compares the table lookups with recomputing the same values on every call
+(the way grid_to_pixel and Grid.neighbors used to be used), and reports the
+end-to-end cost of one headless shot.
+
+    python benchmarks/bench_lookup_tables.py
+"""
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bubble_shot as bs  # noqa: E402
+
+
+def computed_neighbors(c, r):
+    neigh = []
+    for dc, dr in [(-1, 0), (1, 0)]:
+        nc, nr = c + dc, r + dr
+        if 0 <= nc < bs.COLS and 0 <= nr < bs.ROWS:
+            neigh.append((nc, nr))
+    if r % 2 == 0:
+        deltas = [(-1, -1), (0, -1), (-1, 1), (0, 1)]
+    else:
+        deltas = [(1, -1), (0, -1), (0, 1), (1, 1)]
+    for dc, dr in deltas:
+        nc, nr = c + dc, r + dr
+        if 0 <= nc < bs.COLS and 0 <= nr < bs.ROWS:
+            neigh.append((nc, nr))
+    return neigh
+
+
+def computed_pixel_to_grid(px, py):
+    approx_row = int((py - bs.GRID_TOP) / (bs.CELL_RADIUS * 1.73))
+    best = None
+    best_dist = float('inf')
+    for r in range(max(0, approx_row - 2), min(bs.ROWS - 1, approx_row + 2) + 1):
+        for c in range(bs.COLS):
+            gx, gy = bs.grid_to_pixel(c, r)
+            d = math.hypot(gx - px, gy - py)
+            if d < best_dist:
+                best_dist = d
+                best = (c, r)
+    return best
+
+
+def all_cells():
+    return [(c, r) for r in range(bs.ROWS) for c in range(bs.COLS)]
+
+
+def bench(label, fn, number):
+    per_call = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{label:<40} {per_call * 1e6:10.2f} us")
+    return per_call
+
+
+def shot_cost(grid_class, games=200):
+    rng = random.Random(7)
+    random.seed(7)
+    shots = 0
+    start = timeit.default_timer()
+    for _ in range(games):
+        session = bs.GameSession(grid_class=grid_class)
+        while not session.game_over:
+            session.play_shot(rng.uniform(bs.MIN_ANGLE, bs.MAX_ANGLE))
+            shots += 1
+    return (timeit.default_timer() - start) / shots
+
+
+def main():
+    cells = all_cells()
+    points = [(random.uniform(0, bs.SCREEN_WIDTH), random.uniform(bs.GRID_TOP, 500)) for _ in range(200)]
+
+    old = bench("neighbors, computed (all cells)", lambda: [computed_neighbors(c, r) for c, r in cells], 200)
+    new = bench("neighbors, table (all cells)", lambda: [bs.CELL_NEIGHBOR_CELLS[r * bs.COLS + c] for c, r in cells], 200)
+    print(f"{'':<40} {old / new:10.1f} x")
+
+    old = bench("centers, grid_to_pixel (all cells)", lambda: [bs.grid_to_pixel(c, r) for c, r in cells], 200)
+    new = bench("centers, table (all cells)", lambda: [bs.CELL_CENTERS[r * bs.COLS + c] for c, r in cells], 200)
+    print(f"{'':<40} {old / new:10.1f} x")
+
+    old = bench("pixel_to_grid, computed (200 points)", lambda: [computed_pixel_to_grid(x, y) for x, y in points], 20)
+    new = bench("pixel_to_grid_fast (200 points)", lambda: [bs.pixel_to_grid_fast(x, y) for x, y in points], 20)
+    print(f"{'':<40} {old / new:10.1f} x")
+
+    for grid_class in (bs.Grid, bs.BitboardGrid):
+        print(f"{'per shot, ' + grid_class.__name__:<40} {shot_cost(grid_class) * 1e6:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark the three pixel-to-cell lookups, after checking they agree.
+
+Before timing, pixel_to_grid and pixel_to_grid_fast are compared with the
+brute-force reference on random points (on and around the board, including
+exact ties on cell boundaries); any mismatch aborts with a non-zero exit.
+
+    python benchmarks/bench_pixel_to_grid.py [--points N] [--seed S]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bubble_shot as bs  # noqa: E402
+
+
+def random_points(rng, n):
+    x_lo, x_hi = -bs.CELL_DIAM, bs.SCREEN_WIDTH + bs.CELL_DIAM
+    y_lo = bs.GRID_TOP - bs.CELL_DIAM
+    y_hi = bs.GRID_TOP + bs.ROWS * bs.ROW_HEIGHT + bs.CELL_DIAM
+    points = []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            # Integer points hit exact distance ties between neighbouring cells.
+            points.append((rng.randint(x_lo, x_hi), rng.randint(y_lo, y_hi)))
+        else:
+            points.append((rng.uniform(x_lo, x_hi), rng.uniform(y_lo, y_hi)))
+    return points
+
+
+def check(points):
+    mismatches = 0
+    for px, py in points:
+        want = bs.pixel_to_grid_bruteforce(px, py)
+        for fn in (bs.pixel_to_grid, bs.pixel_to_grid_fast):
+            got = fn(px, py)
+            if got != want:
+                mismatches += 1
+                print(f"MISMATCH {fn.__name__}({px!r}, {py!r}) = {got}, bruteforce = {want}")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    points = random_points(rng, args.points)
+    mismatches = check(points)
+    print(f"checked {len(points)} points against pixel_to_grid_bruteforce: {mismatches} mismatches")
+    if mismatches:
+        return 1
+
+    sample = points[:1000]
+    baseline = None
+    for fn in (bs.pixel_to_grid_bruteforce, bs.pixel_to_grid_fast, bs.pixel_to_grid):
+        per_call = min(timeit.repeat(lambda: [fn(x, y) for x, y in sample], number=5, repeat=5)) / (5 * len(sample))
+        baseline = baseline or per_call
+        print(f"{fn.__name__:<26} {per_call * 1e6:8.2f} us/call  {baseline / per_call:6.1f} x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
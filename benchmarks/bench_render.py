@@ -0,0 +1,64 @@
+"""Frame-time benchmark for the two bubble render paths at full-board occupancy.
+
+Draws a completely filled board plus the shot and next-preview bubbles to an
+offscreen surface, once with per-bubble pygame.draw primitives and once with
+BubbleAtlas sprites batched through Surface.blits.
+
+    python benchmarks/bench_render.py [--frames N]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame  # noqa: E402
+
+import bubble_shot as bs  # noqa: E402
+
+
+def full_grid(seed=0):
+    random.seed(seed)
+    return bs.Grid(max_colors=len(bs.COLORS), initial_rows=bs.ROWS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    screen = pygame.display.set_mode((bs.SCREEN_WIDTH, bs.SCREEN_HEIGHT))
+    target = screen.copy()
+    atlas = bs.BubbleAtlas()
+    grid = full_grid()
+    shot = bs.Bubble(bs.SHOOTER_POS[0], bs.SHOOTER_POS[1] - 200, 0)
+    preview = bs.Bubble(bs.NEXT_PREVIEW_POS[0], bs.NEXT_PREVIEW_POS[1], 1)
+
+    def primitives():
+        target.fill(bs.BACKGROUND_COLOR)
+        grid.draw(target)
+        shot.draw(target)
+        preview.draw(target)
+
+    def sprites():
+        target.fill(bs.BACKGROUND_COLOR)
+        grid.draw(target, atlas)
+        shot.draw(target, atlas)
+        preview.draw(target, atlas)
+
+    occupied = sum(ci is not None for col in grid.cells for ci in col)
+    print(f"{occupied} bubbles on the board, {args.frames} frames per run")
+    baseline = None
+    for label, fn in (("pygame.draw primitives", primitives), ("atlas + Surface.blits", sprites)):
+        per_frame = min(timeit.repeat(fn, number=args.frames, repeat=5)) / args.frames
+        baseline = baseline or per_frame
+        print(f"{label:<26} {per_frame * 1e3:8.3f} ms/frame  {baseline / per_frame:6.1f} x")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
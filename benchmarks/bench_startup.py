@@ -0,0 +1,84 @@
+"""Startup time: importing bubble_shot, and from the import to the first frame on screen.
+
+Each run is a fresh interpreter. Import runs time `import bubble_shot` and
+check that it leaves pygame (and so SDL) unloaded, as simulation workers
+rely on. Game runs start `bubble_shot.py play --frames 1 --profile FILE`
+and read back the startup_ms that main() records, which covers the
+import, display and font set-up and drawing the first frame. Reports the
+median and best of --runs; with --budget MS, exits non-zero if the median
+time to the first frame exceeds it.
+
+    python benchmarks/bench_startup.py [--runs 10] [--budget MS]
+
+The game runs use the dummy SDL video driver unless SDL_VIDEODRIVER is set.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "bubble_shot.py")
+
+IMPORT_PROBE = """
+import sys, time
+sys.path.insert(0, %r)
+start = time.perf_counter()
+import bubble_shot
+elapsed = time.perf_counter() - start
+print(elapsed, "pygame.base" in sys.modules)
+""" % ROOT
+
+
+def import_run():
+    """(seconds to import bubble_shot, whether that loaded pygame)."""
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], check=True, capture_output=True, text=True).stdout
+    secs, loaded = out.split()
+    return float(secs), loaded == "True"
+
+
+def game_run(env):
+    """Seconds from importing bubble_shot to its first frame, as recorded in the frame profile."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profile.json")
+        subprocess.run([sys.executable, SCRIPT, "play", "--frames", "1", "--profile", path],
+                       check=True, capture_output=True, env=env, cwd=tmp)
+        with open(path) as f:
+            return json.load(f)["startup_ms"] / 1000
+
+
+def report(label, samples):
+    print(f"{label:<24} median {statistics.median(samples) * 1e3:8.1f} ms  best {min(samples) * 1e3:8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, metavar="MS", help="fail if the median time to first frame exceeds MS")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+    imports = [import_run() for _ in range(args.runs)]
+    report("import bubble_shot", [secs for secs, _ in imports])
+    first_frames = [game_run(env) for _ in range(args.runs)]
+    report("import to first frame", first_frames)
+
+    failures = 0
+    if any(loaded for _, loaded in imports):
+        print("importing bubble_shot loaded pygame")
+        failures += 1
+    if args.budget is not None and statistics.median(first_frames) * 1e3 > args.budget:
+        print(f"median time to first frame is over the {args.budget:g} ms budget")
+        failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
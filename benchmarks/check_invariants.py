@@ -0,0 +1,214 @@
+"""Behavior checks for rules the benchmarks rely on but do not verify.
+
+Unlike the benchmarks, these measure nothing: each check plays seeded
+shots or games and reports every case that breaks its rule. The script
+exits non-zero if any check fails.
+
+    python benchmarks/check_invariants.py [--seeds 5] [--filter TEXT]
+
+landing: a shot that stops on a bubble lands next to it whenever that
+bubble has an empty neighbor, a shot that reaches the ceiling lands in
+row 0 when the cell above it is empty, and version 1 and 2 replays play
+back through Grid.legacy_landing_cell().
+
+floating: Grid.remove_floating_groups(removed) only re-checks the
+components next to the popped cells and the unverified placements, which
+finds every floating bubble as long as each floating component holds an
+unverified placement (or connectivity_stale is set). Seeded games of
+shots, add_row_top(), snapshot()/restore() and fork() check that this
+holds after every step, and that no pop leaves a bubble a full pass
+would drop.
+"""
+import argparse
+import os
+import random
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bubble_shot as bs  # noqa: E402
+from bench_core import FILL_LEVELS, GRID_CLASSES, board  # noqa: E402
+
+ANGLES = 200
+FLOATING_GAMES = 40  # per --seeds; the failures this check exists for show up in about one game in 50
+STEPS = 300
+
+
+def check_landing_touches_hit(seeds):
+    for grid_class in GRID_CLASSES:
+        for fill in (0.05,) + FILL_LEVELS:
+            for seed in range(seeds):
+                grid = board(grid_class, fill, seed)
+                session = bs.GameSession(grid_class=grid_class, seed=seed, undo=False)
+                session.grid = grid
+                for i in range(ANGLES):
+                    angle = bs.MIN_ANGLE + (bs.MAX_ANGLE - bs.MIN_ANGLE) * (i + 0.5) / ANGLES
+                    path = session.trace(angle)
+                    c, r = path.landing
+                    where = "%s fill=%.2f seed=%d angle=%.4f" % (grid_class.__name__, fill, seed, angle)
+                    if grid.get(c, r) is not None:
+                        yield "%s: landed in occupied cell %s" % (where, path.landing)
+                    if path.hit_cell is None:
+                        x = path.contact[0]
+                        above = min(max(round((x - grid.layout.x0) / grid.layout.diam), 0), grid.cols - 1)
+                        if grid.get(above, 0) is None and r != 0:
+                            yield "%s: ceiling hit landed in row %d" % (where, r)
+                        continue
+                    neighbors = grid.neighbors(*path.hit_cell)
+                    if path.landing not in neighbors and any(grid.get(nc, nr) is None for nc, nr in neighbors):
+                        yield "%s: landed at %s, not next to hit bubble %s" % (where, path.landing, path.hit_cell)
+
+
+def check_ceiling_row(seeds):
+    # On an empty board every shot reaches the ceiling, whatever it bounces off on the way.
+    for grid_class in GRID_CLASSES:
+        session = bs.GameSession(grid_class=grid_class, seed=0, undo=False)
+        session.grid = grid_class(initial_rows=0, rng=random.Random(0))
+        for i in range(ANGLES):
+            angle = bs.MIN_ANGLE + (bs.MAX_ANGLE - bs.MIN_ANGLE) * (i + 0.5) / ANGLES
+            path = session.trace(angle)
+            if path.hit_cell is None and path.landing[1] != 0:
+                yield "%s angle=%.4f: ceiling hit on an empty board landed at %s" % (
+                    grid_class.__name__, angle, path.landing)
+
+
+def legacy_replays(seeds):
+    """Version 1 and 2 replays of games played by the legacy landing rule."""
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        session = bs.GameSession(seed=seed, undo=False, legacy_landing=True)
+        while not session.game_over and len(session.shots) < 40:
+            session.play_shot(rng.uniform(bs.MIN_ANGLE, bs.MAX_ANGLE))
+        replay = bs.Replay.from_session(session)
+        yield bs.Replay.from_bytes(replay.to_bytes())
+        v1 = bs.Replay.HEADER_V1.pack(bs.Replay.MAGIC, 1, replay.seed, len(replay.shots), replay.final_score,
+                                      replay.final_level, replay.grid_hash)
+        v1 += b"".join(bs.Replay.SHOT.pack(int(round(t * 1000)), a) for t, a in replay.shots)
+        yield bs.Replay.from_bytes(v1)
+
+
+def check_legacy_replays(seeds):
+    calls = [0]
+    legacy = bs.Grid.legacy_landing_cell
+
+    def counting(self, px, py):
+        calls[0] += 1
+        return legacy(self, px, py)
+
+    bs.Grid.legacy_landing_cell = counting
+    try:
+        for replay in legacy_replays(seeds):
+            for grid_class in GRID_CLASSES:
+                calls[0] = 0
+                ok, session = bs.play_replay(replay, grid_class=grid_class)
+                where = "v%d replay seed=%d on %s" % (replay.version, replay.seed, grid_class.__name__)
+                if not ok:
+                    yield "%s: does not play back" % where
+                if calls[0] < len(replay.shots):
+                    yield "%s: %d shots but %d legacy landings" % (where, len(replay.shots), calls[0])
+    finally:
+        bs.Grid.legacy_landing_cell = legacy
+
+
+def full_pass_floating(grid):
+    """Cells a full drop pass would remove from `grid`, which is left as it was."""
+    clone = grid.fork()
+    clone.connectivity_stale = True
+    clone.remove_floating_groups()
+    return {(c, r) for c, r, _ in clone.last_dropped}
+
+
+def components(grid, cells):
+    """Connected components of `cells`, as sets."""
+    left = set(cells)
+    while left:
+        seen = {left.pop()}
+        stack = list(seen)
+        while stack:
+            for n in grid.neighbors(*stack.pop()):
+                if n in left:
+                    left.discard(n)
+                    seen.add(n)
+                    stack.append(n)
+        yield seen
+
+
+def check_floating_seeded(seeds):
+    for seed in range(seeds * FLOATING_GAMES):
+        rng = random.Random(seed)
+        # The legacy landing rule can place a bubble touching nothing, which is what unverified is for.
+        session = bs.GameSession(seed=seed, undo=False, legacy_landing=seed % 2 == 1)
+        grid = session.grid = board(bs.Grid, rng.choice(FILL_LEVELS), seed)
+        grid.legacy_landing = session.legacy_landing
+        snapshots = []
+        for step in range(STEPS):
+            roll = rng.random()
+            if roll < 0.6:
+                op = "shot"
+                c, r = session.trace(rng.uniform(bs.MIN_ANGLE, bs.MAX_ANGLE)).landing
+                if r >= grid.rows - 1:
+                    op = "new board"
+                    grid = session.grid = board(bs.Grid, rng.choice(FILL_LEVELS), rng.randrange(1 << 30))
+                    grid.legacy_landing = session.legacy_landing
+                    snapshots = []
+                else:
+                    grid.place_bubble(c, r, rng.randrange(len(bs.COLORS)))
+                    grid.pop_if_matching(c, r)
+            elif roll < 0.7:
+                op = "add_row_top"
+                grid.add_row_top()
+            elif roll < 0.8:
+                op = "snapshot"
+                snapshots.append(grid.snapshot())
+            elif roll < 0.9:
+                op = "restore"
+                if snapshots:
+                    try:
+                        grid.restore(rng.choice(snapshots))
+                    except ValueError:  # a state discarded by writing after going back
+                        pass
+            else:
+                op = "fork"
+                grid = session.grid = grid.fork()
+                snapshots = []
+            where = "seed=%d step=%d after %s" % (seed, step, op)
+            floating = full_pass_floating(grid)
+            if op == "shot" and floating and grid.last_popped:
+                yield "%s: the pop left %d floating bubbles" % (where, len(floating))
+            if grid.connectivity_stale:
+                continue
+            for component in components(grid, floating):
+                if not component & grid.unverified:
+                    yield "%s: floating component of %d bubbles has no unverified placement" % (
+                        where, len(component))
+
+
+CHECKS = {
+    "landing": (check_landing_touches_hit, check_ceiling_row, check_legacy_replays),
+    "floating": (check_floating_seeded,),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seeds", type=int, default=5, help="boards or games per case")
+    parser.add_argument("--filter", metavar="TEXT", help="only run checks whose name contains TEXT")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for group, checks in CHECKS.items():
+        for check in checks:
+            name = "%s.%s" % (group, check.__name__[len("check_"):])
+            if args.filter and args.filter not in name:
+                continue
+            problems = list(check(args.seeds))
+            for problem in problems[:10]:
+                print("  " + problem)
+            print("%-40s %s" % (name, "FAIL (%d)" % len(problems) if problems else "ok"))
+            failures += len(problems)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
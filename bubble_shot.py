@@ -1,11 +1,50 @@
-import pygame
+import time
+
+IMPORT_TIME = time.perf_counter()  # start of the import-to-first-frame startup time
+
+import argparse
+import array
+import csv
+import hashlib
+import heapq
+import importlib.util
+import json
 import math
+import os
+import queue
 import random
-from collections import deque
+import struct
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def lazy_import(name):
+    """`name` as a module that is only executed on first attribute access, or None if not installed."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Only the renderer touches pygame, so headless simulation and replay checks never load SDL.
+pygame = lazy_import("pygame")
+np = lazy_import("numpy")  # None: ParticleSystem falls back to the array module
 
 SCREEN_WIDTH = 640
 SCREEN_HEIGHT = 800
 FPS = 60
+IDLE_WAIT_MS = 500       # longest main() sleeps on the event queue when nothing is animating
+PHYSICS_HZ = 120         # fixed simulation rate of main(), independent of FPS
+MAX_PHYSICS_STEPS = 8    # per frame; time beyond this after a hitch is dropped
 GRID_TOP = 60            
 CELL_RADIUS = 20         
 CELL_DIAM = CELL_RADIUS * 2
@@ -15,6 +54,20 @@ SHOOTER_Y = SCREEN_HEIGHT - 80
 SHOOTER_POS = (SCREEN_WIDTH // 2, SHOOTER_Y)
 SHOT_BASE_SPEED = 600    
 POP_MIN = 3              
+SHOT_HOLD_DIST = 36
+NEXT_PREVIEW_POS = (SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20)
+MIN_ANGLE = -math.pi * 0.95
+MAX_ANGLE = -0.05
+AIM_EPSILON = 1e-3       # radians the aim must move before the aim guide is traced again
+AIM_DOT_SPACING = 12
+PARTICLE_GRAVITY = 1800  # px/s^2
+POP_FRAGMENTS = 6        # particles each popped bubble bursts into
+POP_FRAGMENT_RADIUS = 5
+POP_FRAGMENT_SPEED = 260
+POP_FRAGMENT_LIFE = 0.4
+DROP_SPREAD = 60         # px/s of sideways jitter given to falling bubbles
+# Gap between the last row of the default board and the shooter.
+SHOOTER_MARGIN = SHOOTER_Y - (GRID_TOP + (ROWS - 1) * int(CELL_RADIUS * 1.73))
 
 
 COLORS = [
@@ -33,8 +86,22 @@ BORDER_COLOR = (20, 20, 20)
 HIT_SCORE = 10              
 DROP_BONUS_SCORE = 15        
 LEVEL_CREDIT_REWARD = 10    
+UNDO_COST = 5               # credits to take back a shot
 LEVEL_BANNER_TIME = 2.0  
 
+# Profiling: set PROFILE_ENV to a JSON path to profile main() from the start (e.g. headless runs).
+PROFILE_ENV = "BUBBLE_SHOT_PROFILE"
+DEFAULT_PROFILE_PATH = "bubble_shot_profile.json"
+# Telemetry: set EVENTS_ENV to a path to stream game events from main() to a rotating binary log.
+EVENTS_ENV = "BUBBLE_SHOT_EVENTS"
+
+# Fonts are loaded from file rather than looked up with SysFont, which scans the
+# system fonts. None is the freesansbold.ttf bundled with pygame.
+FONT_PATH = None
+HUD_FONT_SIZE = 26
+BANNER_FONT_SIZE = 48
+PROFILE_FONT_SIZE = 18
+
 def clamp(v, a, b):
     return max(a, min(b, v))
 
@@ -49,6 +116,155 @@ def grid_to_pixel(col, row):
     return int(x), int(y)
 
 
+
+ROW_PARITY_DELTAS = (
+    ((-1, 0), (1, 0), (-1, -1), (0, -1), (-1, 1), (0, 1)),  # even rows
+    ((-1, 0), (1, 0), (1, -1), (0, -1), (0, 1), (1, 1)),    # odd rows (shifted right)
+)
+
+
+class BoardLayout:
+    """Geometry, lookup tables and bitboard masks for a board of cols x rows cells.
+
+    Cells are keyed by flat index r * cols + c, which is also their bit in a
+    bitboard. The radius defaults to CELL_RADIUS, shrunk if needed so the
+    board fits the screen width; rows extend downwards as far as they go,
+    and the game scrolls to follow them. Layouts are immutable, so get()
+    shares one per size.
+    """
+
+    MIN_RADIUS = 2
+    MAX_COLS = (SCREEN_WIDTH // MIN_RADIUS - 1) // 2  # the most that fit the screen at MIN_RADIUS
+
+    _cache = {}
+
+    @classmethod
+    def get(cls, cols=COLS, rows=ROWS, radius=None):
+        key = (cols, rows, radius)
+        layout = cls._cache.get(key)
+        if layout is None:
+            layout = cls._cache[key] = cls(cols, rows, radius)
+        return layout
+
+    def __init__(self, cols=COLS, rows=ROWS, radius=None):
+        if cols < 2 or rows < 2:
+            raise ValueError("a board needs at least 2 columns and 2 rows, got %dx%d" % (cols, rows))
+        if radius is None:
+            radius = min(CELL_RADIUS, SCREEN_WIDTH // (2 * cols + 1))
+        if radius < self.MIN_RADIUS:
+            raise ValueError("%d columns do not fit the screen (at most %d)" % (cols, self.MAX_COLS))
+        self.cols = cols
+        self.rows = rows
+        self.radius = radius
+        self.diam = radius * 2
+        self.row_height = int(radius * 1.73)  # ~sqrt(3)
+        self.x0 = radius + (SCREEN_WIDTH - (cols * self.diam + radius)) // 2
+        self.centers = tuple(self.cell_center(i % cols, i // cols) for i in range(cols * rows))
+        self.neighbor_cells = tuple(
+            tuple(
+                (c + dc, r + dr)
+                for dc, dr in ROW_PARITY_DELTAS[r % 2]
+                if 0 <= c + dc < cols and 0 <= r + dr < rows
+            )
+            for r in range(rows)
+            for c in range(cols)
+        )
+        self.neighbors = tuple(tuple(nr * cols + nc for nc, nr in n) for n in self.neighbor_cells)
+        self._neighbor_array = None
+
+        # Bitboard masks: cell (c, r) is bit r * cols + c.
+        row_mask = (1 << cols) - 1
+        self.full_mask = (1 << (cols * rows)) - 1
+        self.top_row_mask = row_mask
+        self.bottom_row_mask = row_mask << (cols * (rows - 1))
+        self.first_col_mask = sum(1 << (r * cols) for r in range(rows))
+        self.last_col_mask = self.first_col_mask << (cols - 1)
+        self.even_rows_mask = sum(row_mask << (r * cols) for r in range(0, rows, 2))
+        self.odd_rows_mask = self.full_mask & ~self.even_rows_mask
+
+    def cell_center(self, c, r):
+        return c * self.diam + self.x0 + (self.radius if r % 2 else 0), GRID_TOP + r * self.row_height
+
+    def row_y(self, r):
+        return GRID_TOP + r * self.row_height
+
+    def visible_rows(self, top, bottom):
+        """Range of rows whose bubbles overlap the pixel rows [top, bottom)."""
+        lo = (top - GRID_TOP - self.radius) // self.row_height + 1
+        hi = -((GRID_TOP - self.radius - bottom) // self.row_height)
+        return range(max(0, lo), min(self.rows, hi))
+
+    def pixel_to_cell(self, px, py):
+        """Exact nearest cell in constant time, by inverting the offset layout.
+
+        The nearest center lies in one of the two rows bracketing py (the two
+        edge rows when py is off the board), and within a row it is the rounded,
+        clamped column. The row above is also checked because, off the side of
+        the board, it can tie with the row below. At most three candidates are
+        compared, and ties resolve like pixel_to_grid_bruteforce (lower row,
+        then lower column).
+        """
+        cols = self.cols
+        centers = self.centers
+        r0 = min(max(math.floor((py - GRID_TOP) / self.row_height), 0), self.rows - 2)
+        best = None
+        best_dist = float('inf')
+        for r in range(max(0, r0 - 1), r0 + 2):
+            base = r * cols
+            c = min(max(math.ceil((px - centers[base][0]) / self.diam - 0.5), 0), cols - 1)
+            gx, gy = centers[base + c]
+            d = math.hypot(gx - px, gy - py)
+            if d < best_dist:
+                best_dist = d
+                best = (c, r)
+        return best
+
+    def dilate(self, m):
+        """All cells adjacent to a cell in bitmask `m`, on the offset hex layout of Grid.neighbors."""
+        cols = self.cols
+        not_first = m & ~self.first_col_mask
+        not_last = m & ~self.last_col_mask
+        even_left = m & self.even_rows_mask & ~self.first_col_mask
+        odd_right = m & self.odd_rows_mask & ~self.last_col_mask
+        out = (not_first >> 1) | (not_last << 1)
+        out |= (m >> cols) | (m << cols)
+        out |= (even_left >> (cols + 1)) | (even_left << (cols - 1))
+        out |= (odd_right >> (cols - 1)) | (odd_right << (cols + 1))
+        return out & self.full_mask
+
+    def grow(self, seed, region):
+        """Flood `seed` through the cells of `region` by repeated dilation."""
+        cur = seed & region
+        while True:
+            nxt = cur | (self.dilate(cur) & region)
+            if nxt == cur:
+                return cur
+            cur = nxt
+
+    def mask_cells(self, m):
+        cols = self.cols
+        out = []
+        while m:
+            low = m & -m
+            i = low.bit_length() - 1
+            out.append((i % cols, i // cols))
+            m ^= low
+        return out
+
+    def neighbor_array(self):
+        """Neighbors as an (n_cells, 6) NumPy index array, short rows padded with the cell itself. Built once."""
+        if self._neighbor_array is None:
+            self._neighbor_array = np.array([n + (i,) * (6 - len(n)) for i, n in enumerate(self.neighbors)],
+                                            dtype=np.intp)
+        return self._neighbor_array
+
+
+# Lookup tables of the default board, built once at import and keyed by flat cell index.
+DEFAULT_LAYOUT = BoardLayout.get()
+ROW_HEIGHT = DEFAULT_LAYOUT.row_height
+CELL_CENTERS = DEFAULT_LAYOUT.centers
+CELL_NEIGHBOR_CELLS = DEFAULT_LAYOUT.neighbor_cells
+
 def pixel_to_grid_bruteforce(px, py):
     """Slow but simple. Kept as fallback/reference."""
     best = None
@@ -67,35 +283,99 @@ def pixel_to_grid_fast(px, py):
     """Faster nearest-cell lookup by searching only nearby rows.
     Uses a row hint from the y position to reduce checks significantly.
     """
-    row_height = CELL_RADIUS * 1.73
-    approx_row = int((py - GRID_TOP) / row_height)
+    approx_row = int((py - GRID_TOP) / (CELL_RADIUS * 1.73))
     start_row = max(0, approx_row - 2)
     end_row = min(ROWS - 1, approx_row + 2)
+    if start_row > end_row:
+        return pixel_to_grid_bruteforce(px, py)
 
     best = None
     best_dist = float('inf')
-    for r in range(start_row, end_row + 1):
-        for c in range(COLS):
-            gx, gy = grid_to_pixel(c, r)
-            d = math.hypot(gx - px, gy - py)
-            if d < best_dist:
-                best_dist = d
-                best = (c, r)
-    if best is None:
-        return pixel_to_grid_bruteforce(px, py)
-    return best
+    centers = CELL_CENTERS
+    for i in range(start_row * COLS, (end_row + 1) * COLS):
+        gx, gy = centers[i]
+        dx = gx - px
+        dy = gy - py
+        d = dx * dx + dy * dy
+        if d < best_dist:
+            best_dist = d
+            best = i
+    return best % COLS, best // COLS
+
+
+def pixel_to_grid(px, py):
+    """Nearest cell of the default board in constant time (see BoardLayout.pixel_to_cell)."""
+    return DEFAULT_LAYOUT.pixel_to_cell(px, py)
+
+
+def draw_bubble(surf, color, x, y, r):
+    """Body, shine and border of one bubble. Returns the bounding rect."""
+    rect = pygame.draw.circle(surf, color, (x, y), r)
+    pygame.draw.circle(surf, SHINE_COLOR, (x - int(r * 0.4), y - int(r * 0.4)), int(r * 0.25))
+    pygame.draw.circle(surf, BORDER_COLOR, (x, y), r, 2)
+    return rect
+
+
+class BubbleAtlas:
+    """Pre-rendered, anti-aliased bubble sprites: one per color and radius.
+
+    Sprites are drawn once at 4x size and smooth-scaled down, then packed one
+    strip per radius. blit_args() yields (source, dest, area) tuples so many
+    bubbles can be drawn with a single Surface.blits call. Needs a display
+    mode to be set (for convert_alpha).
+    """
+
+    SUPERSAMPLE = 4
+
+    def __init__(self, radii=(CELL_RADIUS,)):
+        self.strips = {}
+        for r in radii:
+            self._build(r)
+
+    def _build(self, r):
+        size = r * 2
+        s = self.SUPERSAMPLE
+        strip = pygame.Surface((size * len(COLORS), size), pygame.SRCALPHA)
+        big = pygame.Surface((size * s, size * s), pygame.SRCALPHA)
+        for ci, color in enumerate(COLORS):
+            big.fill((0, 0, 0, 0))
+            pygame.draw.circle(big, color, (r * s, r * s), r * s)
+            pygame.draw.circle(big, SHINE_COLOR, (int(r * 0.6 * s), int(r * 0.6 * s)), int(r * 0.25 * s))
+            pygame.draw.circle(big, BORDER_COLOR, (r * s, r * s), r * s, 2 * s)
+            strip.blit(pygame.transform.smoothscale(big, (size, size)), (ci * size, 0))
+        self.strips[r] = strip.convert_alpha()
+        return self.strips[r]
+
+    def blit_args(self, color_index, x, y, r=CELL_RADIUS):
+        strip = self.strips.get(r) or self._build(r)
+        size = r * 2
+        return strip, (x - r, y - r), (color_index * size, 0, size, size)
+
+    def draw(self, surf, color_index, x, y, r=CELL_RADIUS):
+        return surf.blit(*self.blit_args(color_index, x, y, r))
 
 
 class Bubble:
+    __slots__ = ("x", "y", "r", "color_index", "vx", "vy", "moving")
+
     def __init__(self, x, y, color_index, radius=CELL_RADIUS):
+        self.r = radius
+        self.reset(x, y, color_index)
+
+    def reset(self, x, y, color_index=None):
+        """Reuse this bubble at rest at (x, y), optionally recolored. Returns self."""
         self.x = x
         self.y = y
-        self.r = radius
-        self.color_index = color_index
-        self.color = COLORS[color_index]
+        if color_index is not None:
+            self.color_index = color_index
         self.vx = 0.0
         self.vy = 0.0
         self.moving = False
+        return self
+
+    @property
+    def color(self):
+        return COLORS[self.color_index]
 
     def set_velocity(self, vx, vy):
         self.vx = vx
@@ -115,79 +395,478 @@ class Bubble:
             self.x = SCREEN_WIDTH - self.r
             self.vx *= -1
 
-    def draw(self, surf):
-        pygame.draw.circle(surf, self.color, (int(self.x), int(self.y)), self.r)
-        
-        shine_x = int(self.x - self.r * 0.4)
-        shine_y = int(self.y - self.r * 0.4)
-        pygame.draw.circle(surf, SHINE_COLOR, (shine_x, shine_y), int(self.r * 0.25))
-        pygame.draw.circle(surf, BORDER_COLOR, (int(self.x), int(self.y)), self.r, 2)
+    def draw(self, surf, atlas=None, view_top=0):
+        y = int(self.y) - view_top
+        if atlas is not None:
+            return atlas.draw(surf, self.color_index, int(self.x), y, self.r)
+        return draw_bubble(surf, self.color, int(self.x), y, self.r)
+
+
+class ParticleSystem:
+    """Struct-of-arrays store for many free-moving bubbles, such as falling clusters and pop bursts.
+
+    Every field is one array indexed by particle, so update() integrates
+    gravity and moves all particles in a few whole-array NumPy operations,
+    and drops the ones that have expired or fallen below the view in one
+    compaction. Without NumPy (or with vectorized=False) the arrays are
+    array.array and updated in a plain loop. Positions are board pixels,
+    like Bubble's. burst() and drop() turn a landing's popped and dropped
+    cells into particles.
+    """
+
+    FLOAT_FIELDS = ("x", "y", "vx", "vy", "life")
+    INT_FIELDS = ("color", "radius")
+
+    def __init__(self, gravity=PARTICLE_GRAVITY, capacity=256, vectorized=True):
+        self.gravity = gravity
+        self.vectorized = vectorized and np is not None
+        self.count = 0
+        if self.vectorized:
+            for name in self.FLOAT_FIELDS:
+                setattr(self, name, np.zeros(capacity))
+            for name in self.INT_FIELDS:
+                setattr(self, name, np.zeros(capacity, dtype=np.int32))
+        else:
+            for name in self.FLOAT_FIELDS:
+                setattr(self, name, array.array("d"))
+            for name in self.INT_FIELDS:
+                setattr(self, name, array.array("i"))
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, xs, ys, vxs, vys, colors, radius=CELL_RADIUS, life=float("inf")):
+        """Add one particle per entry of the equal-length sequences. `radius` and `life` may be scalars."""
+        n = len(xs)
+        if not n:
+            return
+        radii = [radius] * n if isinstance(radius, int) else radius
+        lives = [life] * n if isinstance(life, (int, float)) else life
+        values = dict(x=xs, y=ys, vx=vxs, vy=vys, life=lives, color=colors, radius=radii)
+        if not self.vectorized:
+            for name, column in values.items():
+                getattr(self, name).extend(column)
+            self.count += n
+            return
+        start = self.count
+        end = start + n
+        if end > len(self.x):
+            capacity = max(end, 2 * len(self.x))
+            for name in self.FLOAT_FIELDS + self.INT_FIELDS:
+                grown = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                grown[:start] = getattr(self, name)[:start]
+                setattr(self, name, grown)
+        for name, column in values.items():
+            getattr(self, name)[start:end] = column
+        self.count = end
+
+    def burst(self, layout, cells, rng, fragments=POP_FRAGMENTS):
+        """Break each popped (c, r, color_index) bubble into `fragments` pieces flying outwards."""
+        xs, ys, vxs, vys, colors = [], [], [], [], []
+        centers = layout.centers
+        for c, r, ci in cells:
+            x, y = centers[r * layout.cols + c]
+            for k in range(fragments):
+                a = (k + rng.random()) * 2 * math.pi / fragments
+                speed = POP_FRAGMENT_SPEED * rng.uniform(0.6, 1.3)
+                xs.append(x)
+                ys.append(y)
+                vxs.append(math.cos(a) * speed)
+                vys.append(math.sin(a) * speed)
+                colors.append(ci)
+        self.spawn(xs, ys, vxs, vys, colors, POP_FRAGMENT_RADIUS, POP_FRAGMENT_LIFE)
+
+    def drop(self, layout, cells, rng):
+        """Let each dropped (c, r, color_index) bubble fall from its cell until it leaves the view."""
+        centers = layout.centers
+        points = [centers[r * layout.cols + c] for c, r, _ in cells]
+        self.spawn([x for x, _ in points], [y for _, y in points],
+                   [rng.uniform(-DROP_SPREAD, DROP_SPREAD) for _ in cells],
+                   [rng.uniform(-DROP_SPREAD, 0) for _ in cells],
+                   [ci for _, _, ci in cells], layout.radius)
+
+    def clear(self):
+        self.count = 0
+        if not self.vectorized:
+            for name in self.FLOAT_FIELDS + self.INT_FIELDS:
+                del getattr(self, name)[:]
+
+    def update(self, dt, bottom=SCREEN_HEIGHT):
+        """Advance every particle by `dt` and cull those expired or entirely below board row `bottom`."""
+        n = self.count
+        if not n:
+            return
+        g = self.gravity * dt
+        if not self.vectorized:
+            x, y, vx, vy, life, radius = self.x, self.y, self.vx, self.vy, self.life, self.radius
+            keep = []
+            for i in range(n):
+                vy[i] += g
+                x[i] += vx[i] * dt
+                y[i] += vy[i] * dt
+                life[i] -= dt
+                keep.append(life[i] > 0 and y[i] - radius[i] < bottom)
+            if not all(keep):
+                for name in self.FLOAT_FIELDS + self.INT_FIELDS:
+                    column = getattr(self, name)
+                    setattr(self, name, array.array(column.typecode, (v for v, k in zip(column, keep) if k)))
+                self.count = len(self.x)
+            return
+        vy = self.vy[:n]
+        vy += g
+        x = self.x[:n]
+        x += self.vx[:n] * dt
+        y = self.y[:n]
+        y += vy * dt
+        life = self.life[:n]
+        life -= dt
+        keep = (life > 0) & (y - self.radius[:n] < bottom)
+        if not keep.all():
+            kept = int(keep.sum())
+            for name in self.FLOAT_FIELDS + self.INT_FIELDS:
+                column = getattr(self, name)
+                column[:kept] = column[:n][keep]
+            self.count = kept
+
+    def draw(self, surf, atlas=None, view_top=0):
+        """Draw every particle, with one Surface.blits() call given an atlas.
+
+        Returns the dirty region as a single rect around all particles (or
+        none), so a burst of hundreds costs one restore and one update.
+        """
+        n = self.count
+        if not n:
+            return []
+        if self.vectorized:
+            xs = self.x[:n].astype(np.int32)
+            ys = (self.y[:n] - view_top).astype(np.int32)
+            radii = self.radius[:n]
+            left, top = int((xs - radii).min()), int((ys - radii).min())
+            right, bottom = int((xs + radii).max()), int((ys + radii).max())
+            xs, ys, colors, radii = xs.tolist(), ys.tolist(), self.color[:n].tolist(), radii.tolist()
+        else:
+            xs = [int(v) for v in self.x]
+            ys = [int(v - view_top) for v in self.y]
+            colors = self.color
+            radii = self.radius
+            left, top = min(x - r for x, r in zip(xs, radii)), min(y - r for y, r in zip(ys, radii))
+            right, bottom = max(x + r for x, r in zip(xs, radii)), max(y + r for y, r in zip(ys, radii))
+        if atlas is not None:
+            blit_args = atlas.blit_args
+            surf.blits([blit_args(ci, x, y, r) for x, y, ci, r in zip(xs, ys, colors, radii)], doreturn=False)
+        else:
+            for x, y, ci, r in zip(xs, ys, colors, radii):
+                draw_bubble(surf, COLORS[ci], x, y, r)
+        rect = pygame.Rect(left, top, right - left + 1, bottom - top + 1).clip(surf.get_rect())
+        return [rect] if rect else []
 
 
 class Grid:
-    def __init__(self, max_colors=len(COLORS)):
-        self.cells = [[None for _ in range(ROWS)] for _ in range(COLS)]
+    """Bubbles on a cols x rows board.
+
+    Rows are kept in a ring buffer (logical row r is _rows[(_head + r) % rows]),
+    so add_row_top() rewrites one row instead of shifting the board. Every
+    write goes through _set(), which keeps per-color and per-row counts, so
+    active_colors(), any_bubbles_left() and bottom_occupied() do not scan
+    the board. Read cells with get(c, r) or row(r). fork() makes a cheap
+    copy-on-write snapshot for trying moves out, and snapshot()/restore()
+    roll this grid back and forth along a delta log of its writes.
+    """
+
+    def __init__(self, max_colors=len(COLORS), initial_rows=5, rng=None, cols=COLS, rows=ROWS):
+        self.layout = BoardLayout.get(cols, rows)
+        self.cols = cols
+        self.rows = rows
+        self._rows = [[None] * cols for _ in range(rows)]
+        self._head = 0
+        self._row_counts = [0] * rows  # indexed like _rows
+        self._shared = set()  # indices into _rows still shared with a fork, copied on first write
+        self._row_cells = [None] * rows  # row_cells() cache, by logical row
+        self.color_counts = [0] * len(COLORS)
         self.score = 0
+        # Any object with randrange(); the global random module unless a session passes its own.
+        self.rng = rng if rng is not None else random
         self.max_colors = max_colors
-        self.populate_initial_rows(5, max_colors=max_colors)
-
+        # Cells changed since the renderer last synced; dirty_all means "redraw everything".
+        self.dirty_cells = set()
+        self.dirty_all = True
+        # Placed cells whose link to the ceiling has not been checked since the last
+        # drop pass; every other occupied cell is known to be anchored, unless
+        # connectivity_stale asks for a full pass.
+        self.unverified = set()
+        self.connectivity_stale = False
+        # (c, r, color_index) of the bubbles the last pop_if_matching() popped and the last
+        # drop pass removed, for effects and logging; the cells themselves are empty by then.
+        self.last_popped = []
+        self.last_dropped = []
+        # Optional EventBus; pop_if_matching() emits a "pop" event for every group it pops.
+        self.events = None
+        # Resolve landings with legacy_landing_cell(), for replays recorded before it was replaced.
+        self.legacy_landing = False
+        # Delta log behind snapshot()/restore(): (c, r, old, new) per write and (None, down) per
+        # scroll. Entries from _history_pos on were undone and are kept for redo. None until
+        # the first snapshot().
+        self._history = None
+        self._history_pos = 0
+        self.populate_initial_rows(initial_rows, max_colors=max_colors)
+
+    def get(self, c, r):
+        return self._rows[(self._head + r) % self.rows][c]
+
+    def row(self, r):
+        """Row r as a list indexed by column. Read-only: write through place_bubble/remove_cells."""
+        return self._rows[(self._head + r) % self.rows]
+
+    def row_count(self, r):
+        """Number of bubbles in row r."""
+        return self._row_counts[(self._head + r) % self.rows]
+
+    def row_cells(self, r):
+        """[(c, center), ...] for the bubbles in row r, cached until the row changes."""
+        cells = self._row_cells[r]
+        if cells is None:
+            base = r * self.cols
+            centers = self.layout.centers
+            cells = self._row_cells[r] = [(c, centers[base + c]) for c, ci in enumerate(self.row(r)) if ci is not None]
+        return cells
+
+    @property
+    def cells(self):
+        """Column-major copy of the board, cells[c][r]."""
+        rows = [self.row(r) for r in range(self.rows)]
+        return [[row[c] for row in rows] for c in range(self.cols)]
+
+    def _set(self, c, r, color_index):
+        """Write one cell and keep the counts current. Returns the previous value."""
+        i = (self._head + r) % self.rows
+        row = self._rows[i]
+        if self._shared and i in self._shared:
+            row = self._rows[i] = row[:]
+            self._shared.discard(i)
+        self._row_cells[r] = None
+        old = row[c]
+        if old is not None:
+            self.color_counts[old] -= 1
+            self._row_counts[i] -= 1
+        if color_index is not None:
+            self.color_counts[color_index] += 1
+            self._row_counts[i] += 1
+        row[c] = color_index
+        if self._history is not None:
+            self._record((c, r, old, color_index))
+        return old
+
+    def _record(self, entry):
+        history = self._history
+        pos = self._history_pos
+        if pos < len(history):
+            del history[pos:]  # a new write discards the undone states
+        history.append(entry)
+        self._history_pos = pos + 1
+
+    def _scroll(self, down=True):
+        """Move every row down one place, the bottom row's slot becoming row 0, or with down=False back up."""
+        self._head = (self._head + (-1 if down else 1)) % self.rows
+        self._row_cells = [None] * self.rows
+        if self._history is not None:
+            self._record((None, down))
+
+    def snapshot(self):
+        """Opaque token for the current cells, score and connectivity state, for restore().
+
+        The first call starts logging every write, after which taking a
+        snapshot is O(1). clear_history() stops the log.
+        """
+        if self._history is None:
+            self._history = []
+            self._history_pos = 0
+        history = self._history
+        pos = self._history_pos
+        return (history, pos, history[pos - 1] if pos else None, self.score,
+                self.connectivity_stale, frozenset(self.unverified))
+
+    def restore(self, snapshot):
+        """Return to a snapshot() of this grid, backwards (undo) or forwards (redo).
+
+        Replays the delta log between the two states, so the cost is the
+        number of writes in between rather than the size of the board.
+        Writing after going back discards the states ahead of it; restoring
+        one of those raises ValueError.
+        """
+        history, pos, last, score, stale, unverified = snapshot
+        if history is not self._history or pos > len(history) or (pos and history[pos - 1] is not last):
+            raise ValueError("snapshot is not in this grid's history")
+        start = self._history_pos
+        if pos < start:
+            entries, undo = reversed(history[pos:start]), True
+        else:
+            entries, undo = history[start:pos], False
+        self._history = None  # replayed writes are not logged again
+        try:
+            for entry in entries:
+                if entry[0] is None:
+                    self._scroll(entry[1] != undo)
+                    self.dirty_all = True
+                else:
+                    c, r, old, new = entry
+                    self._set(c, r, old if undo else new)
+                    self.dirty_cells.add((c, r))
+        finally:
+            self._history = history
+        self._history_pos = pos
+        self.score = score
+        self.connectivity_stale = stale
+        self.unverified = set(unverified)
+
+    def clear_history(self):
+        """Stop logging writes and invalidate every snapshot."""
+        self._history = None
+        self._history_pos = 0
+
+    def fork(self):
+        """Independent copy of this grid in O(rows), for simulating moves.
+
+        Row lists are shared until either grid writes to one. The fork has
+        no pending redraws, snapshot history or event bus, and keeps the
+        parent's rng object.
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._rows = self._rows[:]
+        clone._row_counts = self._row_counts[:]
+        clone._row_cells = self._row_cells[:]
+        clone.color_counts = self.color_counts[:]
+        clone.dirty_cells = set()
+        clone.unverified = set(self.unverified)
+        clone._history = None
+        clone._history_pos = 0
+        clone.events = None
+        self._shared = set(range(self.rows))
+        clone._shared = set(self._shared)
+        return clone
 
     def populate_initial_rows(self, num_rows, max_colors=None):
         maxc = max_colors if max_colors is not None else self.max_colors
         for r in range(num_rows):
-            for c in range(COLS):
-                color_idx = random.randrange(maxc)
-                self.cells[c][r] = color_idx
+            for c in range(self.cols):
+                color_idx = self.rng.randrange(maxc)
+                self._set(c, r, color_idx)
+        # Whole rows hanging from the ceiling are anchored, so connectivity stays valid.
+        self.dirty_all = True
 
     def add_row_top(self, num_rows=1, max_colors=None):
         maxc = max_colors if max_colors is not None else self.max_colors
         for _ in range(num_rows):
-            
-            for r in reversed(range(1, ROWS)):
-                for c in range(COLS):
-                    self.cells[c][r] = self.cells[c][r-1]
-          
-            for c in range(COLS):
-                self.cells[c][0] = random.randrange(maxc)
-
-    def draw(self, surf):
-        for r in range(ROWS):
-            for c in range(COLS):
-                ci = self.cells[c][r]
+            # The bottom row's slot becomes the new top row; its bubbles fall off the board.
+            self._scroll()
+            for c in range(self.cols):
+                self._set(c, 0, self.rng.randrange(maxc))
+        self.dirty_all = True
+        # Shifting flips row parity, which changes who neighbours whom.
+        self.connectivity_stale = True
+
+    def draw(self, surf, atlas=None, view_top=0):
+        """Draw the rows that fall inside `surf` when board pixel row `view_top` is at its top."""
+        layout = self.layout
+        centers = layout.centers
+        radius = layout.radius
+        cols = self.cols
+        rows = [r for r in layout.visible_rows(view_top, view_top + surf.get_height()) if self.row_count(r)]
+        if atlas is not None:
+            blit_args = atlas.blit_args
+            surf.blits([
+                blit_args(ci, cx, cy - view_top, radius)
+                for r in rows
+                for c, ci in enumerate(self.row(r))
+                if ci is not None
+                for cx, cy in (centers[r * cols + c],)
+            ], False)
+            return
+        for r in rows:
+            base = r * cols
+            for c, ci in enumerate(self.row(r)):
                 if ci is not None:
-                    cx, cy = grid_to_pixel(c, r)
-                    pygame.draw.circle(surf, COLORS[ci], (cx, cy), CELL_RADIUS)
-                    shine_x = cx - int(CELL_RADIUS * 0.4)
-                    shine_y = cy - int(CELL_RADIUS * 0.4)
-                    pygame.draw.circle(surf, SHINE_COLOR, (shine_x, shine_y), int(CELL_RADIUS * 0.25))
-                    pygame.draw.circle(surf, BORDER_COLOR, (cx, cy), CELL_RADIUS, 2)
-
- 
+                    cx, cy = centers[base + c]
+                    draw_bubble(surf, COLORS[ci], cx, cy - view_top, radius)
+
+
     def active_colors(self):
-        s = set()
-        for r in range(ROWS):
-            for c in range(COLS):
-                ci = self.cells[c][r]
-                if ci is not None:
-                    s.add(ci)
+        s = {ci for ci, n in enumerate(self.color_counts) if n}
         if not s:
-           
+
             return set(range(self.max_colors))
         return s
 
-    def place_bubble_at_pixel(self, bubble):
-   
-        c, r = pixel_to_grid_fast(bubble.x, bubble.y)
-        c = int(clamp(c, 0, COLS - 1))
-        r = int(clamp(r, 0, ROWS - 1))
-        if self.cells[c][r] is not None:
+    def landing_cell(self, px, py, hit_cell=None):
+        """Cell a bubble stopping at pixel (px, py) snaps into, without placing it.
+
+        `hit_cell` is the bubble it stopped against, and the landing cell is
+        that bubble's empty neighbour nearest the point, so the new bubble
+        always touches it. Without one, the nearest cell is taken if empty
+        and otherwise treated as the bubble hit.
+        """
+        if self.legacy_landing:
+            return self.legacy_landing_cell(px, py)
+        if hit_cell is None:
+            hit_cell = self.layout.pixel_to_cell(px, py)
+            if self.get(*hit_cell) is None:
+                return hit_cell
+        return self._nearest_empty(px, py, hit_cell)
+
+    def ceiling_cell(self, px, py):
+        """Row-0 cell a bubble stopping against the ceiling at (px, py) snaps into."""
+        if self.legacy_landing:
+            return self.legacy_landing_cell(px, py)
+        layout = self.layout
+        c = min(max(math.floor((px - layout.x0) / layout.diam + 0.5), 0), self.cols - 1)
+        if self.get(c, 0) is None:
+            return c, 0
+        return self._nearest_empty(px, py, (c, 0))
+
+    def _nearest_empty(self, px, py, cell):
+        """Empty neighbour of `cell` nearest (px, py), widening ring by ring over the hex table if all are full."""
+        neighbor_cells = self.layout.neighbor_cells
+        centers = self.layout.centers
+        cols = self.cols
+        get = self.get
+        seen = {cell}
+        ring = [cell]
+        while ring:
+            outer = []
+            for c, r in ring:
+                for n in neighbor_cells[r * cols + c]:
+                    if n not in seen:
+                        seen.add(n)
+                        outer.append(n)
+            best = None
+            best_dist = float("inf")
+            for c, r in outer:
+                if get(c, r) is None:
+                    gx, gy = centers[r * cols + c]
+                    d = (gx - px) * (gx - px) + (gy - py) * (gy - py)
+                    if d < best_dist:
+                        best_dist = d
+                        best = (c, r)
+            if best is not None:
+                return best
+            ring = outer
+        return cell  # the board is full
+
+    def legacy_landing_cell(self, px, py):
+        """Landing rule before replay format 3: the nearest cell, or the first empty one in a square scan around it.
+
+        The scanned cell need not touch the board. Kept so older replays
+        play back exactly; see legacy_landing.
+        """
+        c, r = self.layout.pixel_to_cell(px, py)
+        if self.get(c, r) is not None:
 
             found = False
             for rad in range(1, 3):
                 for dc in range(-rad, rad + 1):
                     for dr in range(-rad, rad + 1):
                         nc, nr = c + dc, r + dr
-                        if 0 <= nc < COLS and 0 <= nr < ROWS and self.cells[nc][nr] is None:
+                        if 0 <= nc < self.cols and 0 <= nr < self.rows and self.get(nc, nr) is None:
                             c, r = nc, nr
                             found = True
                             break
@@ -195,109 +874,531 @@ class Grid:
                         break
                 if found:
                     break
-        self.cells[c][r] = bubble.color_index
         return c, r
 
-    def neighbors(self, c, r):
-        neigh = []
-
-        for dc, dr in [(-1, 0), (1, 0)]:
-            nc, nr = c + dc, r + dr
-            if 0 <= nc < COLS and 0 <= nr < ROWS:
-                neigh.append((nc, nr))
+    def place_bubble(self, c, r, color_index):
+        self._set(c, r, color_index)
+        self.dirty_cells.add((c, r))
+        self.unverified.add((c, r))
+        return c, r
 
-        if r % 2 == 0:
-            deltas = [(-1, -1), (0, -1), (-1, 1), (0, 1)]
-        else:
+    def place_bubble_at_pixel(self, bubble):
+        c, r = self.landing_cell(bubble.x, bubble.y)
+        return self.place_bubble(c, r, bubble.color_index)
 
-            deltas = [(1, -1), (0, -1), (0, 1), (1, 1)]
-        for dc, dr in deltas:
-            nc, nr = c + dc, r + dr
-            if 0 <= nc < COLS and 0 <= nr < ROWS:
-                neigh.append((nc, nr))
-        return neigh
+    def neighbors(self, c, r):
+        return self.layout.neighbor_cells[r * self.cols + c]
 
 
     def flood_fill_group(self, start_c, start_r):
-        if self.cells[start_c][start_r] is None:
+        get = self.get
+        if get(start_c, start_r) is None:
             return []
-        color_idx = self.cells[start_c][start_r]
+        color_idx = get(start_c, start_r)
         visited = set([(start_c, start_r)])
         q = deque([(start_c, start_r)])
         while q:
             c, r = q.popleft()
             for nc, nr in self.neighbors(c, r):
-                if (nc, nr) not in visited and self.cells[nc][nr] == color_idx:
+                if (nc, nr) not in visited and get(nc, nr) == color_idx:
                     visited.add((nc, nr))
                     q.append((nc, nr))
         return list(visited)
 
     def remove_cells(self, cell_list):
-        for c, r in cell_list:
-            self.cells[c][r] = None
-
-    def remove_floating_groups(self):
-        """Remove all bubbles not connected to the top row. Return count removed."""
+        """Empty the cells. Returns [(c, r, color_index), ...] of what was there."""
+        removed = [(c, r, self._set(c, r, None)) for c, r in cell_list]
+        self.dirty_cells.update(cell_list)
+        return removed
+
+    def _floating_near(self, seeds):
+        """Cells of the components containing `seeds` that cannot reach the top row.
+
+        Each component is searched best-first by row, so an anchored one is
+        usually confirmed after climbing straight to the ceiling rather than
+        after visiting all of it.
+        """
+        get = self.get
+        neighbor_cells = self.layout.neighbor_cells
+        cols = self.cols
+        anchored = set()
+        floating = set()
+        for seed in seeds:
+            c, r = seed
+            if get(c, r) is None or seed in anchored or seed in floating:
+                continue
+            seen = {seed}
+            heap = [(r, c)]
+            reached = False
+            while heap:
+                r, c = heapq.heappop(heap)
+                if r == 0 or (c, r) in anchored:
+                    reached = True
+                    break
+                for n in neighbor_cells[r * cols + c]:
+                    if n not in seen and get(n[0], n[1]) is not None:
+                        seen.add(n)
+                        heapq.heappush(heap, (n[1], n[0]))
+            (anchored if reached else floating).update(seen)
+        return floating
+
+    def remove_floating_groups(self, removed=None):
+        """Remove all bubbles not connected to the top row. Return count removed.
+
+        Pass the cells just `removed` to re-check only the components next to
+        them (plus any unverified placements), so the cost scales with the
+        popped region rather than the board. Without it the whole board is
+        scanned.
+        """
+        if removed is not None and not self.connectivity_stale:
+            seeds = [n for c, r in removed for n in self.neighbors(c, r)]
+            seeds.extend(self.unverified)
+            floating = list(self._floating_near(seeds))
+            self.unverified.clear()
+            self.last_dropped = self.remove_cells(floating)
+            return len(floating)
+
+        self.unverified.clear()
+        self.connectivity_stale = False
+        get = self.get
         visited = set()
         q = deque()
-     
-        for c in range(COLS):
-            if self.cells[c][0] is not None:
+
+        for c, ci in enumerate(self.row(0)):
+            if ci is not None:
                 visited.add((c, 0))
                 q.append((c, 0))
 
         while q:
             c, r = q.popleft()
             for nc, nr in self.neighbors(c, r):
-                if (nc, nr) not in visited and self.cells[nc][nr] is not None:
+                if (nc, nr) not in visited and get(nc, nr) is not None:
                     visited.add((nc, nr))
                     q.append((nc, nr))
 
         floating = []
-        for r in range(ROWS):
-            for c in range(COLS):
-                if self.cells[c][r] is not None and (c, r) not in visited:
+        for r in range(self.rows):
+            if not self.row_count(r):
+                continue
+            for c, ci in enumerate(self.row(r)):
+                if ci is not None and (c, r) not in visited:
                     floating.append((c, r))
-        self.remove_cells(floating)
+        self.last_dropped = self.remove_cells(floating)
         return len(floating)
 
     def pop_if_matching(self, c, r):
-        """Pop matching group, then drop floating clusters. Returns total removed count."""
+        """Pop matching group, then drop floating clusters. Returns total removed count.
+
+        The removed bubbles are left in last_popped and last_dropped.
+        """
+        self.last_popped = []
+        self.last_dropped = []
         total_removed = 0
         group = self.flood_fill_group(c, r)
         if len(group) >= POP_MIN:
-            self.remove_cells(group)
+            self.last_popped = self.remove_cells(group)
             total_removed += len(group)
             self.score += len(group) * HIT_SCORE
 
-            dropped = self.remove_floating_groups()
+            dropped = self.remove_floating_groups(group)
             if dropped > 0:
                 total_removed += dropped
                 self.score += dropped * DROP_BONUS_SCORE
+            if self.events is not None:
+                self._emit_pop(c, r, len(group), dropped)
         return total_removed
 
+    def _emit_pop(self, c, r, popped, dropped):
+        self.events.emit("pop", c=c, r=r, color=self.last_popped[0][2], popped=popped, dropped=dropped,
+                         score_delta=popped * HIT_SCORE + dropped * DROP_BONUS_SCORE)
+
     def any_bubbles_left(self):
-        for r in range(ROWS):
-            for c in range(COLS):
-                if self.cells[c][r] is not None:
-                    return True
-        return False
+        return any(self.color_counts)
 
     def bottom_occupied(self):
-        for c in range(COLS):
-            if self.cells[c][ROWS - 1] is not None:
-                return True
-        return False
+        return self.row_count(self.rows - 1) > 0
+
+    def lowest_row(self):
+        """Index of the lowest row holding a bubble, or -1 if the board is empty."""
+        for r in range(self.rows - 1, -1, -1):
+            if self.row_count(r):
+                return r
+        return -1
+
+    def exposed_rows(self):
+        """Per row, [(c, center), ...] of the bubbles a shot could touch first.
+
+        Bubbles hemmed in on all six sides are left out: a shot always
+        touches one of the neighbours before it can reach them. Passed to
+        solve_shot(obstacles=...), this gives the same result while testing
+        far fewer cells on a crowded board.
+        """
+        get = self.get
+        centers = self.layout.centers
+        neighbor_cells = self.layout.neighbor_cells
+        cols = self.cols
+        out = []
+        for r in range(self.rows):
+            base = r * cols
+            out.append([
+                (c, centers[base + c])
+                for c, ci in enumerate(self.row(r))
+                if ci is not None and (len(neighbor_cells[base + c]) < 6
+                                       or any(get(nc, nr) is None for nc, nr in neighbor_cells[base + c]))
+            ] if self.row_count(r) else [])
+        return out
+
+    def state_hash(self):
+        """64-bit digest of the cell contents, for comparing boards across runs."""
+        data = bytes(255 if ci is None else ci for r in range(self.rows) for ci in self.row(r))
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class BitboardGrid(Grid):
+    """Grid backend that keeps one bitmask per color plus an occupancy mask.
+
+    The row store is still maintained for drawing and collision, but flood
+    fill and ceiling connectivity are resolved with shift-and-mask dilation
+    over the whole board at once (see BoardLayout.dilate), which is much
+    faster for batch simulations.
+    """
+
+    def __init__(self, max_colors=len(COLORS), initial_rows=5, rng=None, cols=COLS, rows=ROWS):
+        self.color_masks = [0] * len(COLORS)
+        self.occupied = 0
+        super().__init__(max_colors=max_colors, initial_rows=initial_rows, rng=rng, cols=cols, rows=rows)
+
+    def _set(self, c, r, color_index):
+        bit = 1 << (r * self.cols + c)
+        old = super()._set(c, r, color_index)
+        if old is not None:
+            self.color_masks[old] &= ~bit
+        if color_index is None:
+            self.occupied &= ~bit
+        else:
+            self.color_masks[color_index] |= bit
+            self.occupied |= bit
+        return old
+
+    def fork(self):
+        clone = super().fork()
+        clone.color_masks = self.color_masks[:]
+        return clone
+
+    def _scroll(self, down=True):
+        cols = self.cols
+        if down:
+            full = self.layout.full_mask
+            self.color_masks = [(m << cols) & full for m in self.color_masks]
+            self.occupied = (self.occupied << cols) & full
+            super()._scroll(down)
+            return
+        self.color_masks = [m >> cols for m in self.color_masks]
+        self.occupied >>= cols
+        super()._scroll(down)
+        # The row scrolled back in at the bottom was shifted off the masks; take it from the rows.
+        r = self.rows - 1
+        for c, ci in enumerate(self.row(r)):
+            if ci is not None:
+                bit = 1 << (r * cols + c)
+                self.color_masks[ci] |= bit
+                self.occupied |= bit
 
+    def remove_cells(self, cell_list):
+        cols = self.cols
+        clear = 0
+        for c, r in cell_list:
+            clear |= 1 << (r * cols + c)
+        return self._clear_mask(clear)
+
+    def _clear_mask(self, m):
+        cleared = self.layout.mask_cells(m)
+        removed = [(c, r, Grid._set(self, c, r, None)) for c, r in cleared]
+        self.dirty_cells.update(cleared)
+        keep = ~m
+        self.color_masks = [cm & keep for cm in self.color_masks]
+        self.occupied &= keep
+        return removed
+
+    def flood_fill_group(self, start_c, start_r):
+        ci = self.get(start_c, start_r)
+        if ci is None:
+            return []
+        layout = self.layout
+        return layout.mask_cells(layout.grow(1 << (start_r * self.cols + start_c), self.color_masks[ci]))
+
+    def remove_floating_groups(self, removed=None):
+        """Remove all bubbles not connected to the top row. Return count removed.
+
+        `removed` is accepted for parity with Grid but not needed: the
+        dilation pass is word-parallel over the whole board, and walking only
+        the touched components would take as many dilations.
+        """
+        anchored = self.layout.grow(self.occupied & self.layout.top_row_mask, self.occupied)
+        floating = self.occupied & ~anchored
+        self.unverified.clear()
+        self.connectivity_stale = False
+        self.last_dropped = self._clear_mask(floating) if floating else []
+        return len(self.last_dropped)
+
+    def pop_if_matching(self, c, r):
+        """Pop matching group, then drop floating clusters. Returns total removed count."""
+        self.last_popped = []
+        self.last_dropped = []
+        ci = self.get(c, r)
+        if ci is None:
+            return 0
+        group = self.layout.grow(1 << (r * self.cols + c), self.color_masks[ci])
+        popped = bin(group).count("1")
+        if popped < POP_MIN:
+            return 0
+        self.last_popped = self._clear_mask(group)
+        self.score += popped * HIT_SCORE
+        dropped = self.remove_floating_groups()
+        self.score += dropped * DROP_BONUS_SCORE
+        if self.events is not None:
+            self._emit_pop(c, r, popped, dropped)
+        return popped + dropped
+
+
+def board_array(grid):
+    """The board of `grid` as a (rows, cols) int8 NumPy array of color indices, -1 for empty cells."""
+    return np.array([[-1 if ci is None else ci for ci in grid.row(r)] for r in range(grid.rows)], dtype=np.int8)
+
+
+def _label_components(linked, neighbors):
+    """Per-cell component labels of a batch of boards: the flat index of the lowest cell in each component.
+
+    `linked` is (boards, cells, 6): whether each cell joins the neighbor in
+    that slot of `neighbors`. Every pass takes the lowest label over the
+    linked neighbors, then jumps each label to its own label until that
+    settles, so it takes about log2 of the longest path rather than the
+    path itself. Labels are kept as global indices into one flat array so
+    that boards which stop changing can be dropped from later passes.
+    """
+    boards, cells = linked.shape[:2]
+    offsets = (np.arange(boards) * cells)[:, None]
+    labels = np.arange(boards * cells)
+    at = labels.reshape(boards, cells).copy()  # global indices of the cells of the boards still changing
+    # (6, boards, cells): where each cell takes a label from in each slot, itself when not linked.
+    sources = np.where(linked, neighbors, np.arange(cells)[:, None]).transpose(2, 0, 1) + offsets
+    current = at
+    while len(current):
+        merged = current.copy()
+        for src in sources:
+            np.minimum(merged, labels[src], out=merged)
+        labels[at] = merged
+        while True:
+            jumped = labels[merged]
+            if np.array_equal(jumped, merged):
+                break
+            merged = jumped
+            labels[at] = merged
+        changed = (merged != current).any(axis=1)
+        current = merged[changed]
+        at = at[changed]
+        sources = sources[:, changed]
+    return labels.reshape(boards, cells) - offsets
+
+
+class BoardAnalysis:
+    """Same-color groups and floating cells of a batch of boards, from analyze_boards().
+
+    All arrays are (boards, rows, cols). `labels` gives each bubble the flat
+    index r * cols + c of the first cell of its same-color group (-1 for
+    empty cells), so two bubbles are in the same group exactly when their
+    labels match. `floating` marks the bubbles with no path of bubbles to
+    the top row, which remove_floating_groups() would drop.
+    """
 
+    def __init__(self, colors, labels, floating):
+        self.colors = colors
+        self.labels = labels
+        self.floating = floating
+
+    def group_sizes(self):
+        """Size of the group each cell belongs to, 0 for empty cells."""
+        boards, rows, cols = self.labels.shape
+        labels = self.labels.reshape(boards, -1)
+        keys = labels + np.arange(boards)[:, None] * (rows * cols)
+        counts = np.bincount(keys[labels >= 0], minlength=boards * rows * cols)
+        sizes = np.where(labels >= 0, counts[np.maximum(keys, 0)], 0)
+        return sizes.reshape(self.labels.shape)
+
+    def poppable(self):
+        """Bubbles in groups of at least POP_MIN, as a bool mask."""
+        return self.group_sizes() >= POP_MIN
+
+    def color_counts(self, num_colors=len(COLORS)):
+        """(boards, num_colors) number of bubbles of each color on each board."""
+        boards = len(self.colors)
+        colors = self.colors.reshape(boards, -1).astype(np.intp)
+        keys = colors + np.arange(boards)[:, None] * num_colors
+        return np.bincount(keys[colors >= 0], minlength=boards * num_colors).reshape(boards, num_colors)
+
+
+def analyze_boards(boards, removed=None):
+    """Label the same-color groups and find the floating bubbles of many boards in one vectorized pass.
+
+    `boards` is a Grid, a list of Grids of one size, or an int array of
+    color indices (-1 for empty) shaped (rows, cols) or (boards, rows,
+    cols), with rows in Grid order (row 0 under the ceiling, odd rows
+    shifted right). A Grid is read in its logical row order. `removed`, a
+    bool mask of the same shape, empties those cells first, e.g. a group
+    about to pop, so `floating` tells what would drop after it. Results
+    always have a leading boards axis. Needs NumPy.
+    """
+    if np is None:
+        raise ImportError("analyze_boards() needs NumPy")
+    if isinstance(boards, Grid):
+        boards = [boards]
+    if isinstance(boards, (list, tuple)) and boards and isinstance(boards[0], Grid):
+        boards = np.stack([board_array(g) for g in boards])
+    colors = np.asarray(boards)
+    if colors.ndim == 2:
+        colors = colors[None]
+    if colors.ndim != 3:
+        raise ValueError("expected boards shaped (rows, cols) or (boards, rows, cols), got %r" % (colors.shape,))
+    colors = colors.astype(np.int8)
+    if removed is not None:
+        colors = np.where(np.asarray(removed, dtype=bool).reshape(colors.shape), -1, colors).astype(np.int8)
+    count, rows, cols = colors.shape
+    neighbors = BoardLayout.get(cols, rows).neighbor_array()
+    flat = colors.reshape(count, rows * cols)
+    occupied = flat >= 0
+    around = flat[:, neighbors]
+    # A bubble joins a neighbor of its color for groups, and any occupied neighbor for ceiling support.
+    held = occupied[:, :, None] & (around >= 0)
+    labels = _label_components(held & (around == flat[:, :, None]), neighbors)
+    # Label 0..cols-1 means the component reaches row 0, since labels are its lowest flat index.
+    floating = occupied & (_label_components(held, neighbors) >= cols)
+    labels = np.where(occupied, labels, -1)
+    shape = (count, rows, cols)
+    return BoardAnalysis(colors, labels.reshape(shape), floating.reshape(shape))
+
+
+class ShotPath:
+    """Closed-form flight of one shot, as straight segments between wall bounces.
+
+    `points[i]` is where segment i starts and `times[i]` when; the last point
+    is the contact point reached at `duration`. `hit_cell` is the bubble that
+    stopped the shot (None for the ceiling) and `landing` the cell it snaps into.
+    """
+
+    def __init__(self, points, times, vx, vy, hit_cell, landing):
+        self.points = points
+        self.times = times
+        self.vx = vx
+        self.vy = vy
+        self.hit_cell = hit_cell
+        self.landing = landing
+
+    @property
+    def duration(self):
+        return self.times[-1]
+
+    @property
+    def contact(self):
+        return self.points[-1]
+
+    def position(self, t):
+        """Shot center at time t (clamped to the flight)."""
+        if t >= self.times[-1]:
+            return self.points[-1]
+        i = 0
+        while self.times[i + 1] <= t:
+            i += 1
+        x0, y0 = self.points[i]
+        x1, y1 = self.points[i + 1]
+        span = self.times[i + 1] - self.times[i]
+        f = (t - self.times[i]) / span if span > 0 else 1.0
+        return x0 + (x1 - x0) * f, y0 + (y1 - y0) * f
+
+
+def solve_shot(grid, x, y, vx, vy, radius=CELL_RADIUS, obstacles=None):
+    """Trace a shot analytically, reflecting off the side walls.
+
+    Each straight segment is tested once against the ceiling at GRID_TOP and
+    every occupied cell in the rows it can reach, so the result does not
+    depend on frame rate and a fast shot cannot tunnel through a bubble.
+    Returns a ShotPath. The shot must be travelling upwards (vy < 0).
+
+    `obstacles`, e.g. from grid.exposed_rows(), replaces the grid's occupied
+    cells as the ones to test; the landing cell is still resolved on the grid.
+    """
+    layout = grid.layout
+    row_height = layout.row_height
+    x_min = radius
+    x_max = SCREEN_WIDTH - radius
+    hit_dist = radius + layout.radius - 2
+    hit_dist2 = hit_dist * hit_dist
+    ceiling_y = GRID_TOP + radius
+    speed2 = vx * vx + vy * vy
+    sqrt = math.sqrt
+
+    points = [(x, y)]
+    times = [0.0]
+    t_total = 0.0
+    while True:
+        if vx > 0:
+            t_wall = (x_max - x) / vx
+        elif vx < 0:
+            t_wall = (x_min - x) / vx
+        else:
+            t_wall = float('inf')
+        t_ceiling = max(0.0, (ceiling_y - y) / vy)
+        t_end = min(t_wall, t_ceiling)
+
+        y_end = y + vy * t_end
+        r_lo = max(0, int((y_end - hit_dist - GRID_TOP) // row_height))
+        r_hi = min(grid.rows - 1, int((y + hit_dist - GRID_TOP) // row_height) + 1)
+        hit_cell = None
+        for r in range(r_lo, r_hi + 1):
+            cells = grid.row_cells(r) if obstacles is None else obstacles[r]
+            for c, (gx, gy) in cells:
+                # Earliest t in [0, t_end] where the shot's center comes within hit_dist of (gx, gy):
+                # the smaller root of |o + v*t|^2 = hit_dist^2, or 0 if already touching. Kept inline
+                # as this loop is the hottest in the game and in shot search.
+                ox = x - gx
+                oy = y - gy
+                k = ox * ox + oy * oy - hit_dist2
+                if k <= 0:
+                    t = 0.0
+                else:
+                    b = ox * vx + oy * vy
+                    if b >= 0:
+                        continue
+                    disc = b * b - speed2 * k
+                    if disc < 0:
+                        continue
+                    t = (-b - sqrt(disc)) / speed2
+                    if t > t_end:
+                        continue
+                if hit_cell is None or t < t_end:
+                    t_end = t
+                    hit_cell = (c, r)
+
+        x += vx * t_end
+        y += vy * t_end
+        t_total += t_end
+        points.append((x, y))
+        times.append(t_total)
+        if hit_cell is not None or t_end >= t_ceiling:
+            if hit_cell is None:
+                landing = grid.ceiling_cell(x, y)
+            else:
+                landing = grid.landing_cell(x, y, hit_cell)
+            return ShotPath(points, times, vx, vy, hit_cell, landing)
+        vx = -vx
 
-def level_params(level):
-    """Return derived parameters for a level number (1-based)."""
+
+def level_params(level, rows=ROWS):
+    """Return derived parameters for a level number (1-based) on a board of `rows` rows."""
 
     target = 400 + (level - 1) * 450 + max(0, level - 2) * 10
     max_colors = min(2 + level, len(COLORS))  
     shots_to_drop = max(4, 9 - level)          
-    initial_rows = min(5 + (level - 1), ROWS - 2)
+    initial_rows = min(5 + (level - 1), rows - 2)
     shot_speed = SHOT_BASE_SPEED + (level - 1) * 40
     return {
         "target": target,
@@ -310,321 +1411,1561 @@ def level_params(level):
 
 
 
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption("Bubble Shot — Levels & Credits")
-    clock = pygame.time.Clock()
-    font = pygame.font.SysFont("Arial", 20)
-    bigfont = pygame.font.SysFont("Arial", 36, bold=True)
+class GameSession:
+    """All game rules for one play-through, with no rendering or frame pacing.
 
+    Drive it with fire(angle) and step(dt). main() only feeds it input and
+    draws its state, so the same object can be stepped headlessly as fast as
+    the CPU allows. Pass grid_class=BitboardGrid for faster batch runs.
 
-    level = 1
-    credits = 0
-    params = level_params(level)
+    All randomness comes from a per-session random.Random(seed), and every
+    successful fire() is logged in `shots` as (time, angle), so a session
+    can be reproduced exactly from a Replay.
 
-    grid = Grid(max_colors=params["max_colors"])  
+    `cols` and `rows` size the board. Positions are in board pixels; on a
+    board taller than the screen the shooter follows the lowest bubbles
+    down (see shooter_pos), and the renderer scrolls to keep it in view.
 
-    grid.cells = [[None for _ in range(ROWS)] for _ in range(COLS)]
-    grid.populate_initial_rows(params["initial_rows"], max_colors=params["max_colors"])
+    undo_shot() takes back the last shot of the level for UNDO_COST
+    credits, and redo_shot() replays an undone one. Both restore grid
+    snapshots, so they cost what the shot changed, not the board size.
+    Batch runs pass undo=False to skip saving state before every shot.
+    legacy_landing=True plays by the landing rule of older replays (see
+    Grid.legacy_landing_cell).
 
- 
-    current_shot_speed = params["shot_speed"]
-    def make_next_color():
-        active = list(grid.active_colors())
-      
-        palette = list(range(params["max_colors"]))
-        
+    `events`, an optional EventBus, gets a "shot" event for every landing
+    and a "level" event for every level cleared, and is handed to each
+    level's grid for its "pop" events.
+    """
+
+    def __init__(self, grid_class=Grid, seed=None, cols=COLS, rows=ROWS, undo=True, legacy_landing=False,
+                 events=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.clock = 0.0
+        self.shots = []
+        # (level, score, shots fired) for every level cleared so far.
+        self.completed_levels = []
+        self.grid_class = grid_class
+        self.layout = BoardLayout.get(cols, rows)
+        self.level = 1
+        self.credits = 0
+        self.game_over = False
+        self.out_of_shots = False
+        self.shot_path = None
+        self.shot_time = 0.0
+        self.last_dt = 0.0
+        # Optional FrameProfiler; landing charges pop_if_matching to its "pop" phase.
+        self.profiler = None
+        self.undo_enabled = undo
+        self.legacy_landing = legacy_landing
+        self.events = events
+        # Bumped whenever the board or the shooter changes (landing, undo/redo, new level),
+        # so anything derived from them, like the aim guide, knows to recompute.
+        self.board_version = 0
+        # (c, r, color_index) of the bubbles the last landing popped and dropped.
+        self.last_popped = []
+        self.last_dropped = []
+        self._load_level()
+        self.level_banner_timer = 0.0
+
+    def _load_level(self):
+        layout = self.layout
+        self.board_version += 1
+        self.params = level_params(self.level, layout.rows)
+        self.grid = self.grid_class(max_colors=self.params["max_colors"], initial_rows=self.params["initial_rows"],
+                                    rng=self.rng, cols=layout.cols, rows=layout.rows)
+        self.grid.legacy_landing = self.legacy_landing
+        self.grid.events = self.events
+        self.shot_speed = self.params["shot_speed"]
+        self._place_shooter()
+        self.current_bubble = Bubble(*self.shooter_pos, self.make_next_color(), layout.radius)
+        self.next_preview = Bubble(*self.preview_pos, self.make_next_color(), layout.radius)
+        self.shots_fired = 0
+        self.shots_allowed = self.params["shots_to_drop"]
+        self.shots_remaining = self.shots_allowed
+        self.out_of_shots = False
+        # States before each shot of this level, and after each undone one.
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def _place_shooter(self):
+        """Put the shooter SHOOTER_MARGIN below the lowest bubbles, but never above SHOOTER_POS
+        or further below the board's last row. On a board that fits the screen this is SHOOTER_POS.
+        """
+        layout = self.layout
+        low = clamp(layout.row_y(self.grid.lowest_row()), SHOOTER_Y - SHOOTER_MARGIN, layout.row_y(layout.rows - 1))
+        self.shooter_pos = (SHOOTER_POS[0], low + SHOOTER_MARGIN)
+        self.preview_pos = (NEXT_PREVIEW_POS[0], self.shooter_pos[1] + NEXT_PREVIEW_POS[1] - SHOOTER_POS[1])
+
+    def make_next_color(self):
+        active = list(self.grid.active_colors())
+        palette = list(range(self.params["max_colors"]))
         pool = active if active else palette
-        return random.choice(pool)
+        return self.rng.choice(pool)
+
+    def start_next_level(self):
+        self.completed_levels.append((self.level, self.grid.score, self.shots_fired))
+        if self.events is not None:
+            self.events.emit("level", level=self.level, score=self.grid.score, shots=self.shots_fired,
+                             credits=self.credits + LEVEL_CREDIT_REWARD)
+        self.level += 1
+        self.credits += LEVEL_CREDIT_REWARD
+        self._load_level()
+        self.level_banner_timer = LEVEL_BANNER_TIME
+
+    def can_fire(self):
+        return not self.current_bubble.moving and not self.game_over
+
+    def _save_state(self):
+        return (self.grid.snapshot(), self.rng.getstate(), self.current_bubble.color_index,
+                self.next_preview.color_index, self.shots_fired, self.shots_remaining,
+                self.game_over, self.out_of_shots, len(self.shots), self.shots[-1:])
+
+    def _load_state(self, state):
+        (snapshot, rng_state, color, next_color, self.shots_fired, self.shots_remaining,
+         self.game_over, self.out_of_shots, count, last_shot) = state
+        self.grid.restore(snapshot)
+        self.board_version += 1
+        self.rng.setstate(rng_state)
+        # The shot log goes back too, so a Replay made afterwards still plays back exactly.
+        del self.shots[count - len(last_shot):]
+        self.shots.extend(last_shot)
+        self._place_shooter()
+        self.current_bubble.reset(*self.shooter_pos, color)
+        self.next_preview.reset(*self.preview_pos, next_color)
+
+    def can_undo(self):
+        return not self.current_bubble.moving and bool(self.undo_stack) and self.credits >= UNDO_COST
+
+    def undo_shot(self):
+        """Take back the last shot of this level, even one that ended the game, for UNDO_COST credits.
+
+        Returns True if a shot was undone.
+        """
+        if not self.can_undo():
+            return False
+        self.credits -= UNDO_COST
+        self.redo_stack.append(self._save_state())
+        self._load_state(self.undo_stack.pop())
+        return True
+
+    def redo_shot(self):
+        """Replay the last undone shot, free, unless a shot has been fired since. Returns True if it was redone."""
+        if self.current_bubble.moving or not self.redo_stack:
+            return False
+        self.undo_stack.append(self._save_state())
+        self._load_state(self.redo_stack.pop())
+        return True
+
+    def trace(self, angle, obstacles=None):
+        """ShotPath a shot fired now at `angle` would take, without firing it. See solve_shot for `obstacles`."""
+        angle = clamp(angle, MIN_ANGLE, MAX_ANGLE)
+        x = self.shooter_pos[0] + math.cos(angle) * SHOT_HOLD_DIST
+        y = self.shooter_pos[1] + math.sin(angle) * SHOT_HOLD_DIST
+        vx = math.cos(angle) * self.shot_speed
+        vy = math.sin(angle) * self.shot_speed
+        return solve_shot(self.grid, x, y, vx, vy, self.current_bubble.r, obstacles)
+
+    def fire(self, angle):
+        """Launch the current bubble at `angle` (radians, clamped). Returns True if fired."""
+        if not self.can_fire():
+            return False
+        angle = clamp(angle, MIN_ANGLE, MAX_ANGLE)
+        if self.undo_enabled:
+            self.undo_stack.append(self._save_state())
+            self.redo_stack.clear()
+        shot = self.current_bubble
+        shot.x = self.shooter_pos[0] + math.cos(angle) * SHOT_HOLD_DIST
+        shot.y = self.shooter_pos[1] + math.sin(angle) * SHOT_HOLD_DIST
+        shot.set_velocity(math.cos(angle) * self.shot_speed, math.sin(angle) * self.shot_speed)
+        self.shot_path = solve_shot(self.grid, shot.x, shot.y, shot.vx, shot.vy, shot.r)
+        self.shot_time = 0.0
+        self.shots.append((self.clock, angle))
+        return True
+
+    def _land_shot(self):
+        shot = self.current_bubble
+        score = self.grid.score
+        nc, nr = self.grid.place_bubble(*self.shot_path.landing, shot.color_index)
+        self.board_version += 1
+        self.shot_path = None
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark("update")
+        self.grid.pop_if_matching(nc, nr)
+        # Kept here as well as on the grid, which a level change right after replaces.
+        self.last_popped = self.grid.last_popped
+        self.last_dropped = self.grid.last_dropped
+        if profiler is not None:
+            profiler.mark("pop")
+        self._place_shooter()
+        # The preview moves up to the shooter and the landed shot becomes the new preview,
+        # so a landing allocates no bubbles.
+        self.current_bubble = self.next_preview.reset(*self.shooter_pos)
+        self.next_preview = shot.reset(*self.preview_pos, self.make_next_color())
+        self.shots_fired += 1
+        self.shots_remaining = max(0, self.shots_remaining - 1)
+        if self.shots_remaining == 0 and self.grid.score < self.params["target"]:
+            self.game_over = True
+            self.out_of_shots = True
+        if self.events is not None:
+            self.events.emit("shot", clock=self.clock, angle=self.shots[-1][1], c=nc, r=nr,
+                             popped=len(self.last_popped), dropped=len(self.last_dropped),
+                             score_delta=self.grid.score - score, score=self.grid.score, level=self.level,
+                             shots_remaining=self.shots_remaining)
+        return nc, nr
+
+    def step(self, dt):
+        """Advance the game by `dt` seconds. Returns the landing cell if a shot landed."""
+        self.clock += dt
+        self.last_dt = dt
+        if self.level_banner_timer > 0:
+            self.level_banner_timer = max(0.0, self.level_banner_timer - dt)
+
+        landed = None
+        if self.current_bubble.moving:
+            self.shot_time += dt
+            if self.shot_time >= self.shot_path.duration:
+                landed = self._land_shot()
+            else:
+                self.current_bubble.x, self.current_bubble.y = self.shot_path.position(self.shot_time)
+
+        if self.grid.bottom_occupied():
+            self.game_over = True
+            self.out_of_shots = False
+
+        if self.grid.score >= self.params["target"] and not self.game_over:
+            self.start_next_level()
+        return landed
+
+    def shot_position(self, alpha=1.0):
+        """Center of the moving shot `alpha` of the way through the last step (1.0 is its current position).
+
+        The path is analytic, so this is exact even across a wall bounce,
+        unlike blending the last two positions.
+        """
+        t = self.shot_time - (1.0 - alpha) * self.last_dt
+        return self.shot_path.position(max(0.0, t))
+
+    def play_shot(self, angle):
+        """Fire and resolve the shot in a single step. Returns the landing cell, or None if it could not fire."""
+        if not self.fire(angle):
+            return None
+        return self.step(self.shot_path.duration)
+
+
+class Replay:
+    """A recorded session: its seed, the shots fired and the final outcome.
+
+    Binary layout (little-endian): a header of magic b"BSRP", format
+    version (u8), seed (u64), shot count (u32), final score (u32), final
+    level (u16), grid hash (u64) and board columns and rows (u16 each),
+    followed by one record per shot of time in milliseconds (u32) and angle
+    (f64). Angles are stored at full precision so playback lands every shot
+    in the same cell. Version 1 files, which predate board sizes, are read
+    as the default board. Versions 1 and 2 were recorded with the landing
+    rule before Grid.landing_cell() snapped to the hit bubble's neighbours,
+    and are played back with it; version 3 has the same layout as 2.
+    """
 
-    current_bubble = Bubble(SHOOTER_POS[0], SHOOTER_POS[1], make_next_color())
-    current_bubble.moving = False
-    next_preview = Bubble(SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20, make_next_color())
-    next_preview.moving = False
+    MAGIC = b"BSRP"
+    VERSION = 3
+    PREFIX = struct.Struct("<4sB")
+    HEADER_V1 = struct.Struct("<4sBQIIHQ")
+    HEADER = struct.Struct("<4sBQIIHQHH")
+    SHOT = struct.Struct("<Id")
+
+    def __init__(self, seed, shots, final_score, final_level, grid_hash, cols=COLS, rows=ROWS, version=VERSION):
+        self.version = version
+        self.seed = seed
+        self.shots = shots
+        self.final_score = final_score
+        self.final_level = final_level
+        self.grid_hash = grid_hash
+        self.cols = cols
+        self.rows = rows
+
+    @classmethod
+    def from_session(cls, session):
+        shots = list(session.shots)
+        if session.current_bubble.moving:
+            shots.pop()  # still in flight: the recorded outcome does not include it yet
+        return cls(session.seed, shots, session.grid.score, session.level, session.grid.state_hash(),
+                   session.layout.cols, session.layout.rows, 2 if session.legacy_landing else cls.VERSION)
+
+    @property
+    def legacy_landing(self):
+        return self.version < 3
+
+    def to_bytes(self):
+        # Version 1 has no board size; it is written as 2, which plays by the same rules.
+        parts = [self.HEADER.pack(self.MAGIC, max(self.version, 2), self.seed, len(self.shots),
+                                  self.final_score, self.final_level, self.grid_hash, self.cols, self.rows)]
+        parts.extend(self.SHOT.pack(int(round(t * 1000)), angle) for t, angle in self.shots)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a replay. Raises ValueError for anything that is not a complete replay of a known version."""
+        if len(data) < cls.PREFIX.size:
+            raise ValueError("not a bubble shot replay (%d bytes)" % len(data))
+        magic, version = cls.PREFIX.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("not a bubble shot replay")
+        if version not in (1, 2, cls.VERSION):
+            raise ValueError("unsupported replay version %d" % version)
+        header = cls.HEADER_V1 if version == 1 else cls.HEADER
+        if len(data) < header.size:
+            raise ValueError("truncated replay header: %d of %d bytes" % (len(data), header.size))
+        if version == 1:
+            _, _, seed, count, score, level, grid_hash = header.unpack_from(data, 0)
+            cols, rows = COLS, ROWS
+        else:
+            _, _, seed, count, score, level, grid_hash, cols, rows = header.unpack_from(data, 0)
+        body = len(data) - header.size
+        if body != count * cls.SHOT.size:
+            raise ValueError("corrupt replay: %d shots need %d bytes of shot records, found %d"
+                             % (count, count * cls.SHOT.size, body))
+        shots = [(ms / 1000.0, angle) for ms, angle in cls.SHOT.iter_unpack(data[header.size:])]
+        return cls(seed, shots, score, level, grid_hash, cols, rows, version)
+
+    def save(self, path):
+        data = self.to_bytes()  # first, so a replay that cannot be packed leaves no empty file behind
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def play_replay(replay, grid_class=Grid):
+    """Re-simulate a replay headlessly at full speed.
+
+    Timestamps are not waited on: the outcome depends only on the seed and
+    the order of shots. Returns (matches, session) where `matches` says
+    whether the final score, level and grid hash agree with the recording.
+    """
+    session = GameSession(grid_class=grid_class, seed=replay.seed, cols=replay.cols, rows=replay.rows, undo=False,
+                          legacy_landing=replay.legacy_landing)
+    for _, angle in replay.shots:
+        if session.play_shot(angle) is None:
+            return False, session
+    matches = (session.grid.score == replay.final_score
+               and session.level == replay.final_level
+               and session.grid.state_hash() == replay.grid_hash)
+    return matches, session
+
+
+def random_policy(session, rng):
+    return rng.uniform(MIN_ANGLE, MAX_ANGLE)
+
+
+def group_size_if_placed(grid, c, r, color_index):
+    """Size of the same-color group a bubble of `color_index` would join at (c, r)."""
+    seen = {(c, r)}
+    q = deque([(c, r)])
+    while q:
+        for n in grid.neighbors(*q.popleft()):
+            if n not in seen and grid.get(n[0], n[1]) == color_index:
+                seen.add(n)
+                q.append(n)
+    return len(seen)
+
+
+def greedy_policy(session, rng, candidates=48):
+    """Aim for the landing cell that joins the largest same-color group."""
+    color = session.current_bubble.color_index
+    best_angle = random_policy(session, rng)
+    best_size = 0
+    seen = set()
+    for i in range(candidates):
+        angle = MIN_ANGLE + (MAX_ANGLE - MIN_ANGLE) * (i + 0.5) / candidates
+        landing = session.trace(angle).landing
+        if landing in seen:
+            continue
+        seen.add(landing)
+        size = group_size_if_placed(session.grid, landing[0], landing[1], color)
+        if size > best_size:
+            best_size = size
+            best_angle = angle
+    return best_angle
+
+
+class ShotPlanner:
+    """Bot that picks a shot by sweeping angles and playing out each distinct landing cell.
+
+    Angles from MIN_ANGLE to MAX_ANGLE are traced at `sweep` even steps,
+    and every gap between neighbouring angles that land in different cells
+    is bisected up to `depth` times, so narrow openings are found without
+    tracing a fine sweep everywhere. Traces test only grid.exposed_rows().
+    Each distinct landing cell is then placed and popped on a fork() of
+    the grid and scored on the points it gains; shots that pop nothing are
+    ranked by the group they build, preferring higher rows. The best `beam`
+    of them also get `lookahead` times the best follow-up for the
+    next_preview color among the cells this sweep could reach.
+    """
 
-    running = True
-    paused = False
-    game_over = False
-    out_of_shots = False  
+    BUILD_WEIGHT = 1.0
+    DEPTH_WEIGHT = 0.1
+
+    def __init__(self, sweep=48, depth=2, lookahead=0.5, beam=6):
+        self.sweep = sweep
+        self.depth = depth
+        self.lookahead = lookahead
+        self.beam = beam
+
+    def candidates(self, session):
+        """Map each reachable landing cell to the middle of the angles found landing there."""
+        trace = session.trace
+        obstacles = session.grid.exposed_rows()
+        found = {}
+
+        def probe(angle):
+            cell = trace(angle, obstacles).landing
+            found.setdefault(cell, []).append(angle)
+            return cell
+
+        def refine(a0, c0, a1, c1, depth):
+            if c0 == c1 or depth == 0:
+                return
+            mid = (a0 + a1) * 0.5
+            cm = probe(mid)
+            refine(a0, c0, mid, cm, depth - 1)
+            refine(mid, cm, a1, c1, depth - 1)
+
+        step = (MAX_ANGLE - MIN_ANGLE) / (self.sweep - 1)
+        prev_angle = MIN_ANGLE
+        prev_cell = probe(prev_angle)
+        for i in range(1, self.sweep):
+            angle = MIN_ANGLE + step * i
+            cell = probe(angle)
+            refine(prev_angle, prev_cell, angle, cell, self.depth)
+            prev_angle, prev_cell = angle, cell
+        return {cell: sorted(angles)[len(angles) // 2] for cell, angles in found.items()}
+
+    def _play(self, grid, c, r, color):
+        """Fork of `grid` with `color` placed at (c, r) and popped, and the points gained."""
+        g = grid.fork()
+        g.place_bubble(c, r, color)
+        before = g.score
+        g.pop_if_matching(c, r)
+        return g, g.score - before
+
+    def _follow_up(self, grid, cells, color):
+        """Best points a `color` shot into one of `cells` could gain on `grid`."""
+        get = grid.get
+        best = 0
+        for c, r in cells:
+            if get(c, r) is not None:
+                continue
+            attached = r == 0
+            matches = False
+            for nc, nr in grid.neighbors(c, r):
+                ci = get(nc, nr)
+                if ci is not None:
+                    attached = True
+                    matches = matches or ci == color
+            if not (attached and matches) or group_size_if_placed(grid, c, r, color) < POP_MIN:
+                continue
+            best = max(best, self._play(grid, c, r, color)[1])
+        return best
+
+    def evaluate(self, session):
+        """[(value, angle, cell)] for every candidate landing cell, best first."""
+        grid = session.grid
+        color = session.current_bubble.color_index
+        next_color = session.next_preview.color_index
+        candidates = self.candidates(session)
+        cells = list(candidates)
+        scored = []
+        for cell, angle in candidates.items():
+            c, r = cell
+            after, gained = self._play(grid, c, r, color)
+            value = gained - self.DEPTH_WEIGHT * r
+            if gained == 0:
+                value += self.BUILD_WEIGHT * group_size_if_placed(grid, c, r, color)
+            scored.append([value, angle, cell, after])
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        if self.lookahead:
+            for entry in scored[:self.beam]:
+                entry[0] += self.lookahead * self._follow_up(entry[3], cells, next_color)
+            scored.sort(key=lambda s: (-s[0], s[1]))
+        return [(value, angle, cell) for value, angle, cell, _ in scored]
+
+    def choose(self, session, rng=None):
+        """Angle of the best shot for the current bubble. Fits the POLICIES signature."""
+        scored = self.evaluate(session)
+        return scored[0][1] if scored else (MIN_ANGLE + MAX_ANGLE) / 2
+
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "search": ShotPlanner().choose,
+}
+
+
+def simulate_game(seed, policy, grid_class=BitboardGrid, max_level=50, cols=COLS, rows=ROWS):
+    """Play one headless game. Returns (level, cleared, score, shots) rows, one per level played."""
+    session = GameSession(grid_class=grid_class, seed=seed, cols=cols, rows=rows, undo=False)
+    rng = random.Random(seed ^ 0x5EED)
+    while not session.game_over and session.level <= max_level:
+        session.play_shot(policy(session, rng))
+    rows = [(level, True, score, shots) for level, score, shots in session.completed_levels]
+    if session.game_over:
+        rows.append((session.level, False, session.grid.score, session.shots_fired))
+    return rows
+
+
+def simulate_shard(seeds, policy_name, bitboard=True, max_level=50, board=(COLS, ROWS)):
+    """Worker entry point: play the games for `seeds`. Returns [(seed, rows), ...]."""
+    policy = POLICIES[policy_name]
+    grid_class = BitboardGrid if bitboard else Grid
+    return [(seed, simulate_game(seed, policy, grid_class, max_level, *board)) for seed in seeds]
+
+
+class LevelStats:
+    """Running per-level aggregates: attempts, clears, score and shots used."""
+
+    FIELDS = ("level", "games", "cleared", "clear_rate", "mean_score", "mean_shots")
+
+    def __init__(self):
+        self.levels = {}
+
+    def add(self, rows):
+        for level, cleared, score, shots in rows:
+            s = self.levels.setdefault(level, [0, 0, 0, 0])
+            s[0] += 1
+            s[1] += cleared
+            s[2] += score
+            s[3] += shots
+
+    def summary(self):
+        out = []
+        for level in sorted(self.levels):
+            games, cleared, score, shots = self.levels[level]
+            out.append({
+                "level": level,
+                "games": games,
+                "cleared": cleared,
+                "clear_rate": round(cleared / games, 4),
+                "mean_score": round(score / games, 2),
+                "mean_shots": round(shots / games, 2),
+            })
+        return out
+
+    def write(self, path):
+        """Write the current summary as CSV or JSON (by extension), replacing the file atomically."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(self.summary())
+            else:
+                json.dump(self.summary(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def simulate_command(args):
+    seeds = [args.seed + i for i in range(args.games)]
+    workers = args.workers or os.cpu_count() or 1
+    shard_size = args.shard_size or max(1, min(200, args.games // (workers * 8) or 1))
+    shards = [seeds[i:i + shard_size] for i in range(0, len(seeds), shard_size)]
+    stats = LevelStats()
+    records = open(args.records, "w", newline="") if args.records else None
+    record_writer = None
+    if records and args.records.endswith(".csv"):
+        record_writer = csv.writer(records)
+        record_writer.writerow(("seed", "level", "cleared", "score", "shots"))
+
+    start = time.perf_counter()
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(simulate_shard, shard, args.policy, not args.list_grid, args.max_level, args.board)
+                       for shard in shards]
+            for future in as_completed(futures):
+                for seed, rows in future.result():
+                    stats.add(rows)
+                    done += 1
+                    for level, cleared, score, shots in rows:
+                        if record_writer:
+                            record_writer.writerow((seed, level, int(cleared), score, shots))
+                        elif records:
+                            records.write(json.dumps({"seed": seed, "level": level, "cleared": cleared,
+                                                      "score": score, "shots": shots}) + "\n")
+                if records:
+                    records.flush()
+                if args.out:
+                    stats.write(args.out)
+    finally:
+        if records:
+            records.close()
+
+    elapsed = time.perf_counter() - start
+    print("%d games in %.2fs (%.0f games/s, %d workers, policy=%s)" % (
+        done, elapsed, done / elapsed if elapsed else 0.0, workers, args.policy))
+    print("%5s %7s %7s %10s %10s %10s" % ("level", "games", "cleared", "clear_rate", "mean_score", "mean_shots"))
+    for row in stats.summary():
+        print("%5d %7d %7d %10.3f %10.1f %10.2f" % (
+            row["level"], row["games"], row["cleared"], row["clear_rate"], row["mean_score"], row["mean_shots"]))
+    return 0
+
+
+def aim_angle(target_x, target_y):
+    """Clamped launch angle from the shooter towards a screen point."""
+    dx = target_x - SHOOTER_POS[0]
+    dy = target_y - SHOOTER_POS[1]
+    if dy >= -5:
+        dy = -5
+    return clamp(math.atan2(dy, dx), MIN_ANGLE, MAX_ANGLE)
+
+
+class AimGuide:
+    """Dotted preview of the whole path a shot would take, bounces included, with its landing cell ringed.
+
+    update() traces the path again only when the aim has moved by more
+    than AIM_EPSILON or the session's board has changed, and then renders
+    the dots in runs of DOTS_PER_RUN onto small colorkeyed surfaces;
+    draw() is one Surface.blits() of those runs and a circle, and each run
+    is one dirty rect to restore next frame.
+    """
 
-    shots_fired = 0
-    shots_allowed = params["shots_to_drop"] 
-    shots_remaining = shots_allowed
-    level_banner_timer = 0.0
+    DOTS_PER_RUN = 16
+    COLORKEY = (0, 0, 0)  # what new surfaces are cleared to, so runs need no fill
+
+    def __init__(self, spacing=AIM_DOT_SPACING, color=UI_COLOR):
+        self.spacing = spacing
+        self.dot = pygame.Surface((4, 4))
+        pygame.draw.circle(self.dot, color, (2, 2), 2)
+        self.dot.set_colorkey(self.COLORKEY)
+        self.angle = None
+        self.key = None
+        self.path = None
+        self._blits = []
+        self._rects = []
+        self._ring = None
+
+    def update(self, session, angle, view_top=0):
+        """Aim at `angle` on the current board. Returns True if the path was traced again."""
+        key = (session, session.board_version, view_top)
+        if key == self.key and abs(angle - self.angle) <= AIM_EPSILON:
+            return False
+        self.key = key
+        self.angle = angle
+        self.path = path = session.trace(angle)
+
+        # Dots run from the edge of the held bubble to the edge of the bubble where it stops.
+        radius = session.current_bubble.r
+        dots = []
+        points = path.points
+        end = path.duration * math.hypot(path.vx, path.vy) - radius
+        d = radius + self.spacing * 0.5  # distance along the path of the next dot
+        start = 0.0  # and of the current segment's start
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            length = math.hypot(x1 - x0, y1 - y0)
+            stop = min(start + length, end)
+            while d <= stop:
+                t = (d - start) / length
+                dots.append((int(x0 + (x1 - x0) * t) - 2, int(y0 + (y1 - y0) * t - view_top) - 2))
+                d += self.spacing
+            start += length
+
+        screen_rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        self._blits = []
+        self._rects = []
+        n = self.DOTS_PER_RUN
+        for i in range(0, len(dots), n):
+            xs, ys = zip(*dots[i:i + n])
+            left = min(xs)
+            top = min(ys)
+            rect = pygame.Rect(left, top, max(xs) - left + 4, max(ys) - top + 4)
+            surf = pygame.Surface(rect.size)
+            surf.blits([(self.dot, (x - left, y - top)) for x, y in zip(xs, ys)], doreturn=False)
+            surf.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+            self._blits.append((surf, rect.topleft))
+            rect = rect.clip(screen_rect)
+            if rect:
+                self._rects.append(rect)
+
+        layout = session.layout
+        cx, cy = layout.centers[path.landing[1] * layout.cols + path.landing[0]]
+        self._ring = (COLORS[session.current_bubble.color_index], (cx, cy - view_top), layout.radius)
+        return True
 
-    
-    min_angle = -math.pi * 0.95
-    max_angle = -0.05
-
-    def restart_all():
-        nonlocal level, credits, params, grid, current_bubble, next_preview
-        nonlocal shots_fired, shots_allowed, shots_remaining, level_banner_timer, current_shot_speed
-        nonlocal game_over, paused, out_of_shots
-        level = 1
-        credits = 0
-        params = level_params(level)
-        grid = Grid(max_colors=params["max_colors"])
-        grid.cells = [[None for _ in range(ROWS)] for _ in range(COLS)]
-        grid.populate_initial_rows(params["initial_rows"], max_colors=params["max_colors"])
-        current_bubble = Bubble(SHOOTER_POS[0], SHOOTER_POS[1], make_next_color())
-        current_bubble.moving = False
-        next_preview = Bubble(SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20, make_next_color())
-        next_preview.moving = False
-        shots_fired = 0
-        shots_allowed = params["shots_to_drop"]
-        shots_remaining = shots_allowed
-        level_banner_timer = 0.0
-        current_shot_speed = params["shot_speed"]
-        game_over = False
-        paused = False
-        out_of_shots = False
-
-    def start_next_level():
-        nonlocal level, credits, params, grid, current_bubble, next_preview
-        nonlocal shots_fired, shots_allowed, shots_remaining, level_banner_timer, current_shot_speed
-        nonlocal out_of_shots
-        level += 1
-        credits += LEVEL_CREDIT_REWARD
-        params = level_params(level)
-        
-        grid = Grid(max_colors=params["max_colors"])
-        grid.cells = [[None for _ in range(ROWS)] for _ in range(COLS)]
-        grid.populate_initial_rows(params["initial_rows"], max_colors=params["max_colors"])
-        current_bubble = Bubble(SHOOTER_POS[0], SHOOTER_POS[1], make_next_color())
-        current_bubble.moving = False
-        next_preview = Bubble(SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20, make_next_color())
-        next_preview.moving = False
-        shots_fired = 0
-        shots_allowed = params["shots_to_drop"]
-        shots_remaining = shots_allowed
-        level_banner_timer = LEVEL_BANNER_TIME
-        current_shot_speed = params["shot_speed"]
-        out_of_shots = False
-
-    def launch_bubble(bubble, target_x, target_y):
-        dx = target_x - SHOOTER_POS[0]
-        dy = target_y - SHOOTER_POS[1]
-        if dy >= -5:  
-            dy = -5
-        angle = math.atan2(dy, dx)
-        angle = clamp(angle, min_angle, max_angle)
-        vx = math.cos(angle) * current_shot_speed
-        vy = math.sin(angle) * current_shot_speed
-        bubble.set_velocity(vx, vy)
-
-    while running:
-        dt = clock.tick(FPS) / 1000.0
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                elif event.key == pygame.K_r:
-                    restart_all()
-                elif event.key == pygame.K_SPACE:
-                    if not current_bubble.moving and not game_over and not paused:
-                        mx, my = pygame.mouse.get_pos()
-                        launch_bubble(current_bubble, mx, my)
-                elif event.key == pygame.K_p:
-                    paused = not paused
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1 and not game_over and not paused:
-                    if not current_bubble.moving:
-                        mx, my = event.pos
-                        launch_bubble(current_bubble, mx, my)
-
-        if paused:
-            screen.fill(BACKGROUND_COLOR)
-            pygame.draw.rect(screen, (50, 50, 50), (0, GRID_TOP - 10, SCREEN_WIDTH, SCREEN_HEIGHT - GRID_TOP + 10))
-            grid.draw(screen)
-            current_bubble.draw(screen)
-            next_preview.draw(screen)
-            pause_surf_shadow = bigfont.render("PAUSED", True, (0, 0, 0))
-            pause_surf = bigfont.render("PAUSED", True, UI_COLOR)
-            px = SCREEN_WIDTH // 2 - pause_surf.get_width() // 2
-            py = SCREEN_HEIGHT // 2 - pause_surf.get_height() // 2
-            screen.blit(pause_surf_shadow, (px + 2, py + 2))
-            screen.blit(pause_surf, (px, py))
-            pygame.display.flip()
-            continue
+    def draw(self, surf):
+        """Draw the last update()'s guide. Returns the dirty rects."""
+        surf.blits(self._blits, doreturn=False)
+        rects = self._rects[:]
+        if self._ring is not None:
+            color, center, radius = self._ring
+            rects.append(pygame.draw.circle(surf, color, center, radius, 2))
+        return rects
+
+
+class BoardLayer:
+    """Cached scene: background, board panel, shooter base and the grid's bubbles.
+
+    sync() re-renders only the cells the grid marked dirty since the last
+    call and returns the screen rects that changed, so a frame can restore
+    and update just those regions instead of redrawing the whole board.
+    `view_top` is the board pixel row shown at the top of the screen;
+    changing it scrolls the view and repaints the visible rows.
+    """
 
-        if level_banner_timer > 0:
-            level_banner_timer = max(0.0, level_banner_timer - dt)
-
-        if current_bubble.moving:
-            current_bubble.update(dt)
-
-           
-            if current_bubble.y - current_bubble.r <= GRID_TOP:
-                nc, nr = grid.place_bubble_at_pixel(current_bubble)
-                grid.pop_if_matching(nc, nr)
-         
-                current_bubble = Bubble(SHOOTER_POS[0], SHOOTER_POS[1], next_preview.color_index)
-                current_bubble.moving = False
-                next_preview = Bubble(SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20, make_next_color())
-                next_preview.moving = False
-                shots_fired += 1
-
-                shots_remaining = max(0, shots_remaining - 1)
-               
-                if shots_remaining == 0 and grid.score < params["target"]:
-                    game_over = True
-                    out_of_shots = True
+    PANEL_COLOR = (50, 50, 50)
+
+    def __init__(self, screen, atlas=None):
+        self.atlas = atlas
+        self.surface = screen.copy()
+        self.static = screen.copy()
+        self.static.fill(BACKGROUND_COLOR)
+        pygame.draw.rect(self.static, self.PANEL_COLOR, (0, GRID_TOP - 10, SCREEN_WIDTH, SCREEN_HEIGHT - GRID_TOP + 10))
+        pygame.draw.rect(self.static, (60, 60, 60), (SCREEN_WIDTH // 2 - 60, SHOOTER_Y + 35, 120, 8), border_radius=4)
+        self.grid = None
+        self.view_top = 0
+
+    def _cell_rect(self, grid, c, r):
+        layout = grid.layout
+        cx, cy = layout.centers[r * grid.cols + c]
+        return pygame.Rect(cx - layout.radius - 1, cy - self.view_top - layout.radius - 1,
+                           layout.diam + 2, layout.diam + 2)
+
+    def _redraw_all(self, grid):
+        self.surface.blit(self.static, (0, 0))
+        grid.draw(self.surface, self.atlas, self.view_top)
+        return self.surface.get_rect()
+
+    def _redraw_cell(self, grid, c, r):
+        # Bubbles in adjacent rows overlap this cell's rect, so repaint them clipped to it,
+        # in the same row-major order as Grid.draw so overlapping edges come out identical.
+        surf = self.surface
+        layout = grid.layout
+        rect = self._cell_rect(grid, c, r).clip(surf.get_rect())
+        if not rect:
+            return rect  # scrolled out of view
+        surf.set_clip(rect)
+        surf.blit(self.static, rect, rect)
+        for nr, nc in sorted((nr, nc) for nc, nr in ((c, r),) + grid.neighbors(c, r)):
+            ci = grid.get(nc, nr)
+            if ci is not None:
+                cx, cy = layout.centers[nr * grid.cols + nc]
+                cy -= self.view_top
+                if self.atlas is not None:
+                    self.atlas.draw(surf, ci, cx, cy, layout.radius)
+                else:
+                    draw_bubble(surf, COLORS[ci], cx, cy, layout.radius)
+        surf.set_clip(None)
+        return rect
+
+    def sync(self, grid, view_top=0):
+        if grid is not self.grid or grid.dirty_all or view_top != self.view_top:
+            self.grid = grid
+            self.view_top = view_top
+            rects = [self._redraw_all(grid)]
+        else:
+            rects = [self._redraw_cell(grid, c, r) for c, r in grid.dirty_cells]
+        grid.dirty_all = False
+        grid.dirty_cells.clear()
+        return rects
 
-            else:
-     
-                collided = False
-                row_height = CELL_RADIUS * 1.73
-                approx_row = int((current_bubble.y - GRID_TOP) / row_height)
-                start_row = max(0, approx_row - 2)
-                end_row = min(ROWS, approx_row + 3)
-                for r in range(start_row, end_row):
-                    for c in range(COLS):
-                        ci = grid.cells[c][r]
-                        if ci is not None:
-                            gx, gy = grid_to_pixel(c, r)
-                            dist = math.hypot(current_bubble.x - gx, current_bubble.y - gy)
-                            if dist <= current_bubble.r + CELL_RADIUS - 2:
-                                nc, nr = grid.place_bubble_at_pixel(current_bubble)
-                                grid.pop_if_matching(nc, nr)
-                                current_bubble = Bubble(SHOOTER_POS[0], SHOOTER_POS[1], next_preview.color_index)
-                                current_bubble.moving = False
-                                next_preview = Bubble(SHOOTER_POS[0] + 60, SHOOTER_POS[1] + 20, make_next_color())
-                                next_preview.moving = False
-                                shots_fired += 1
-
-                    
-                                shots_remaining = max(0, shots_remaining - 1)
-                       
-                                if shots_remaining == 0 and grid.score < params["target"]:
-                                    game_over = True
-                                    out_of_shots = True
-
-                                collided = True
-                                break
-                    if collided:
-                        break
 
-       
-            
+class TextCache:
+    """LRU cache of rendered text, keyed by (font, text, color).
+
+    HUD strings rarely change between frames, so glyphs are rasterized once
+    and reused. Drop-shadowed text is composed into a single surface, so
+    each label costs one blit per frame.
+    """
 
-      
-        if grid.bottom_occupied():
-            game_over = True
-            out_of_shots = False  
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def _lookup(self, key, build):
+        surf = self._entries.get(key)
+        if surf is not None:
+            self._entries.move_to_end(key)
+            return surf
+        surf = build()
+        self._entries[key] = surf
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return surf
+
+    def render(self, font, text, color):
+        return self._lookup((font, text, color), lambda: font.render(text, True, color))
+
+    def shadowed(self, font, text, color, shadow_offset=(1, 1)):
+        """Text with a black drop shadow `shadow_offset` pixels down-right, as one surface."""
+        def build():
+            fg = font.render(text, True, color)
+            shadow = font.render(text, True, (0, 0, 0))
+            ox, oy = shadow_offset
+            surf = pygame.Surface((fg.get_width() + ox, fg.get_height() + oy), pygame.SRCALPHA)
+            surf.blit(shadow, (ox, oy))
+            surf.blit(fg, (0, 0))
+            return surf
+        return self._lookup((font, text, color, shadow_offset), build)
+
+    def blit_shadowed(self, screen, font, text, color, pos, shadow_offset=(1, 1)):
+        """Blit shadowed text with its foreground at `pos`. Returns the covered rect."""
+        return screen.blit(self.shadowed(font, text, color, shadow_offset), pos)
+
+    def blit_centered(self, screen, font, text, color, y, shadow_offset=(2, 2)):
+        surf = self.shadowed(font, text, color, shadow_offset)
+        return screen.blit(surf, (SCREEN_WIDTH // 2 - (surf.get_width() - shadow_offset[0]) // 2, y))
+
+
+class FixedTimestep:
+    """Accumulator that turns variable frame times into whole steps of `dt`.
+
+    advance() banks a frame's real time and returns how many fixed steps to
+    run, at most `max_steps`; time beyond that is dropped so that a long
+    hitch slows the game down instead of spiralling. `alpha` is the part
+    of a step still banked, for interpolating what is drawn between the
+    previous and the current step. Because every step has the same length,
+    the simulation does not depend on the display rate.
+    """
 
-    
-        if grid.score >= params["target"] and not game_over:
-            start_next_level()
-
-
-        screen.fill(BACKGROUND_COLOR)
-
-        pygame.draw.rect(screen, (50, 50, 50), (0, GRID_TOP - 10, SCREEN_WIDTH, SCREEN_HEIGHT - GRID_TOP + 10))
-        grid.draw(screen)
-
-
-        pygame.draw.rect(screen, (60, 60, 60), (SCREEN_WIDTH // 2 - 60, SHOOTER_Y + 35, 120, 8), border_radius=4)
-
-
-        mx, my = pygame.mouse.get_pos()
-        dx = mx - SHOOTER_POS[0]
-        dy = my - SHOOTER_POS[1]
-        angle = math.atan2(dy, dx)
-        angle = clamp(angle, min_angle, max_angle)
-        length = 70
-        aim_x = SHOOTER_POS[0] + math.cos(angle) * length
-        aim_y = SHOOTER_POS[1] + math.sin(angle) * length
-        dash_length = 5
-        gap_length = 3
-        total_length = math.hypot(aim_x - SHOOTER_POS[0], aim_y - SHOOTER_POS[1])
-        if total_length > 0:
-            num_dashes = int(total_length / (dash_length + gap_length))
-            for i in range(num_dashes):
-                start_ratio = i * (dash_length + gap_length) / total_length
-                end_ratio = start_ratio + dash_length / total_length
-                start_x = SHOOTER_POS[0] + (aim_x - SHOOTER_POS[0]) * start_ratio
-                start_y = SHOOTER_POS[1] + (aim_y - SHOOTER_POS[1]) * start_ratio
-                end_x = SHOOTER_POS[0] + (aim_x - SHOOTER_POS[0]) * end_ratio
-                end_y = SHOOTER_POS[1] + (aim_y - SHOOTER_POS[1]) * end_ratio
-                pygame.draw.line(screen, UI_COLOR, (start_x, start_y), (end_x, end_y), 2)
-
-
-        if current_bubble:
-            if not current_bubble.moving:
-                ang = math.atan2(my - SHOOTER_POS[1], mx - SHOOTER_POS[0])
-                ang = clamp(ang, min_angle, max_angle)
-                hold_dist = 36
-                current_bubble.x = SHOOTER_POS[0] + math.cos(ang) * hold_dist
-                current_bubble.y = SHOOTER_POS[1] + math.sin(ang) * hold_dist
-            current_bubble.draw(screen)
-
-
-        if next_preview:
-            pygame.draw.circle(screen, (80, 80, 80), (next_preview.x, next_preview.y), next_preview.r + 4)
-            next_preview.draw(screen)
-            txt_shadow = font.render("Next", True, (0, 0, 0))
-            txt = font.render("Next", True, UI_COLOR)
-            screen.blit(txt_shadow, (next_preview.x - 19, next_preview.y + 29))
-            screen.blit(txt, (next_preview.x - 20, next_preview.y + 28))
-
-
-        score_surf_shadow = font.render(f"Score: {grid.score}", True, (0, 0, 0))
-        score_surf = font.render(f"Score: {grid.score}", True, UI_COLOR)
-        screen.blit(score_surf_shadow, (13, 13))
-        screen.blit(score_surf, (12, 12))
-
-        level_surf_shadow = font.render(f"Level: {level}", True, (0, 0, 0))
-        level_surf = font.render(f"Level: {level}", True, UI_COLOR)
-        screen.blit(level_surf_shadow, (200 + 13, 13))
-        screen.blit(level_surf, (200 + 12, 12))
-
-        target_surf_shadow = font.render(f"Target: {params['target']}", True, (0, 0, 0))
-        target_surf = font.render(f"Target: {params['target']}", True, UI_COLOR)
-        screen.blit(target_surf_shadow, (320 + 13, 13))
-        screen.blit(target_surf, (320 + 12, 12))
-
-        credits_s_shadow = font.render(f"Credits: {credits}", True, (0, 0, 0))
-        credits_s = font.render(f"Credits: {credits}", True, UI_COLOR)
-        screen.blit(credits_s_shadow, (13, 38))
-        screen.blit(credits_s, (12, 38))
-
-        drop_in_shadow = font.render(f"Shots left: {shots_remaining}", True, (0, 0, 0))
-        drop_in = font.render(f"Shots left: {shots_remaining}", True, UI_COLOR)
-        screen.blit(drop_in_shadow, (200 + 13, 38))
-        screen.blit(drop_in, (200 + 12, 38))
-
-        inst_shadow = font.render("Click or SPACE to shoot. R = restart, P = pause, ESC = quit", True, (0, 0, 0))
-        inst = font.render("Click or SPACE to shoot. R = restart, P = pause, ESC = quit", True, UI_COLOR)
-        screen.blit(inst_shadow, (13, SCREEN_HEIGHT - 27))
-        screen.blit(inst, (12, SCREEN_HEIGHT - 28))
-
-        if level_banner_timer > 0:
-            banner = bigfont.render(f"LEVEL {level}! +{LEVEL_CREDIT_REWARD} credits", True, (200, 220, 20))
-            shadow = bigfont.render(f"LEVEL {level}! +{LEVEL_CREDIT_REWARD} credits", True, (0, 0, 0))
-            bx = SCREEN_WIDTH // 2 - banner.get_width() // 2
-            by = SCREEN_HEIGHT // 2 - 20
-            screen.blit(shadow, (bx + 2, by + 2))
-            screen.blit(banner, (bx, by))
-
-        if game_over:
-            if out_of_shots:
-                lose_msg_shadow = bigfont.render("OUT OF SHOTS. Press R to restart", True, (0, 0, 0))
-                lose_msg = bigfont.render("OUT OF SHOTS. Press R to restart", True, (220, 80, 80))
+    def __init__(self, dt=1.0 / PHYSICS_HZ, max_steps=MAX_PHYSICS_STEPS):
+        self.dt = dt
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def advance(self, frame_dt):
+        self.accumulator += frame_dt
+        steps = int(self.accumulator / self.dt)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = self.dt * steps
+        self.accumulator -= self.dt * steps
+        return steps
+
+    @property
+    def alpha(self):
+        return min(1.0, self.accumulator / self.dt)
+
+
+class FrameProfiler:
+    """Per-phase timings of the main loop.
+
+    Call begin_frame() at the top of every frame and mark(phase) at the end
+    of each phase; the time since the previous mark is charged to `phase`.
+    Each phase keeps a rolling window of per-frame totals for the p50/p99
+    overlay and a histogram over the whole run for dump(). Bucket 0 counts
+    samples under 1 us and bucket k the range [2**(k-1), 2**k) us. Phases
+    not reached in a frame (e.g. "pop") are not sampled for it. When
+    disabled, mark() returns without reading the clock. discard_frame()
+    drops the frame in progress, for loop passes that spent it blocked on
+    input; main() counts the ones that then drew in `wakeups` instead.
+    """
+
+    PHASES = ("idle", "events", "update", "pop", "board", "sprites", "hud", "flip")
+    BUCKETS = 25
+    OVERLAY_REFRESH = 15  # frames between overlay re-renders
+
+    def __init__(self, enabled=False, window=240):
+        self.enabled = enabled
+        self.frames = 0
+        self.wakeups = 0
+        names = self.PHASES + ("frame",)
+        self.windows = {p: deque(maxlen=window) for p in names}
+        self.histograms = {p: [0] * self.BUCKETS for p in names}
+        self.totals = dict.fromkeys(names, 0.0)
+        self.maxima = dict.fromkeys(names, 0.0)
+        self._current = {}
+        self._frame_start = None
+        self._last = None
+        self._overlay = None
+        self._overlay_frame = 0
+        self.startup = None  # seconds from import to the first frame on screen, set by main()
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        self._close(now)
+        self._frame_start = self._last = now if self.enabled else None
+
+    def end_frame(self):
+        """Record the frame in progress, if any."""
+        self._close(time.perf_counter())
+        self._frame_start = self._last = None
+
+    def discard_frame(self):
+        """Drop the frame in progress without recording it."""
+        self._current = {}
+        self._frame_start = self._last = None
+
+    def _close(self, now):
+        if self._frame_start is not None:
+            self._current["frame"] = now - self._frame_start
+            for phase, secs in self._current.items():
+                self._record(phase, secs)
+            self.frames += 1
+        self._current = {}
+
+    def mark(self, phase):
+        if self._last is None:
+            return
+        now = time.perf_counter()
+        self._current[phase] = self._current.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def _record(self, phase, secs):
+        self.windows[phase].append(secs)
+        self.histograms[phase][min(int(secs * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+        self.totals[phase] += secs
+        if secs > self.maxima[phase]:
+            self.maxima[phase] = secs
+
+    def percentiles(self, phase):
+        """(p50, p99) in seconds over the rolling window, or None before the first sample."""
+        s = sorted(self.windows[phase])
+        if not s:
+            return None
+        return s[len(s) // 2], s[min(len(s) - 1, int(len(s) * 0.99))]
+
+    def summary(self):
+        out = {}
+        for phase, hist in self.histograms.items():
+            count = sum(hist)
+            if not count:
+                continue
+            p50, p99 = self.percentiles(phase)
+            out[phase] = {
+                "count": count,
+                "mean_ms": round(self.totals[phase] / count * 1000, 4),
+                "p50_ms": round(p50 * 1000, 4),
+                "p99_ms": round(p99 * 1000, 4),
+                "max_ms": round(self.maxima[phase] * 1000, 4),
+                "histogram_us": {
+                    ("<1" if k == 0 else "%d-%d" % (1 << (k - 1), 1 << k)): n
+                    for k, n in enumerate(hist) if n
+                },
+            }
+        return out
+
+    def dump(self, path):
+        """Write the summary as JSON, replacing the file atomically. p50/p99 are over the last window."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"frames": self.frames, "wakeups": self.wakeups, "window": self.windows["frame"].maxlen,
+                       "startup_ms": None if self.startup is None else round(self.startup * 1000, 2),
+                       "phases": self.summary()}, f, indent=2)
+        os.replace(tmp, path)
+
+    def overlay(self, font):
+        """p50/p99 table as a translucent surface, re-rendered every OVERLAY_REFRESH frames."""
+        if self._overlay is not None and self.frames - self._overlay_frame < self.OVERLAY_REFRESH:
+            return self._overlay
+        rows = [("ms", "p50", "p99")]
+        for phase in self.PHASES + ("frame",):
+            p = self.percentiles(phase)
+            if p is not None:
+                rows.append((phase, "%.2f" % (p[0] * 1000), "%.2f" % (p[1] * 1000)))
+        # The font is proportional, so cells are laid out in columns: names left-aligned, numbers right-aligned.
+        rendered = [[font.render(cell, True, UI_COLOR) for cell in row] for row in rows]
+        widths = [max(row[i].get_width() for row in rendered) + 12 for i in range(3)]
+        height = font.get_linesize()
+        surf = pygame.Surface((sum(widths), height * len(rendered) + 8), pygame.SRCALPHA)
+        surf.fill((0, 0, 0, 170))
+        for i, row in enumerate(rendered):
+            y = 4 + i * height
+            surf.blit(row[0], (6, y))
+            surf.blit(row[1], (widths[0] + widths[1] - 6 - row[1].get_width(), y))
+            surf.blit(row[2], (sum(widths) - 6 - row[2].get_width(), y))
+        self._overlay = surf
+        self._overlay_frame = self.frames
+        return surf
+
+
+class EventBus:
+    """Synchronous publish/subscribe for game telemetry.
+
+    emit(kind, **fields) calls each handler subscribed to `kind`, then each
+    one subscribed to every kind, as handler(kind, fields). Handlers run
+    on the emitting thread, so they should hand slow work off (EventLog
+    only queues the event).
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._any = []
+
+    def subscribe(self, handler, kinds=None):
+        """Call handler(kind, fields) for events of `kinds` (default: all). Returns the handler."""
+        if kinds is None:
+            self._any.append(handler)
+        else:
+            for kind in kinds:
+                self._handlers.setdefault(kind, []).append(handler)
+        return handler
+
+    def unsubscribe(self, handler):
+        self._any = [h for h in self._any if h != handler]
+        for kind, handlers in self._handlers.items():
+            self._handlers[kind] = [h for h in handlers if h != handler]
+
+    def emit(self, kind, **fields):
+        for handler in self._handlers.get(kind, ()):
+            handler(kind, fields)
+        for handler in self._any:
+            handler(kind, fields)
+
+
+class EventLog:
+    """Streams game events to a rotating binary file from a background thread.
+
+    Binary layout (little-endian): each file starts with magic b"BSEV" and
+    format version (u8), followed by one record per event of payload
+    length (u16), event code (u8) and wall-clock time in seconds since the
+    epoch (f64), then the payload: the event's fields packed as in KINDS.
+    The length prefix lets readers skip codes they do not know.
+
+    write() is an EventBus handler that only queues the event, so the game
+    loop never waits on the disk; the thread packs and writes whatever is
+    queued in one go and flushes after each batch. A file that would grow
+    past `max_bytes` is renamed to path.1 (path.1 to path.2, and so on,
+    keeping `backups` of them) and a new one started. An existing file is
+    rotated out the same way first, so a run never appends to a record a
+    crash cut short. Events of kinds not in KINDS are skipped. If writing
+    fails, the error is kept in `error` and later events are dropped.
+    Call close() to flush and stop the thread.
+    """
+
+    MAGIC = b"BSEV"
+    VERSION = 1
+    PREFIX = struct.Struct("<4sB")
+    RECORD = struct.Struct("<HBd")
+    KINDS = {
+        "session": (1, struct.Struct("<QHH"), ("seed", "cols", "rows")),
+        "shot": (2, struct.Struct("<ddHHHHiIHH"), ("clock", "angle", "c", "r", "popped", "dropped",
+                                                   "score_delta", "score", "level", "shots_remaining")),
+        "pop": (3, struct.Struct("<HHBHHi"), ("c", "r", "color", "popped", "dropped", "score_delta")),
+        "level": (4, struct.Struct("<HIHI"), ("level", "score", "shots", "credits")),
+        "frames": (5, struct.Struct("<Iffff"), ("frames", "mean_ms", "max_ms", "busy_mean_ms", "busy_max_ms")),
+    }
+    CODES = {code: (kind, fmt, names) for kind, (code, fmt, names) in KINDS.items()}
+
+    def __init__(self, path, max_bytes=4 << 20, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.error = None
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, name="EventLog", daemon=True)
+        self._thread.start()
+
+    def write(self, kind, fields):
+        self._queue.put((kind, time.time(), fields))
+
+    def close(self):
+        """Write everything queued so far, then stop the thread and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _pack(self, kind, t, fields):
+        spec = self.KINDS.get(kind)
+        if spec is None:
+            return b""
+        code, fmt, names = spec
+        return self.RECORD.pack(fmt.size, code, t) + fmt.pack(*[fields[name] for name in names])
+
+    def _open(self):
+        self._file = open(self.path, "wb")
+        self._size = self._file.write(self.PREFIX.pack(self.MAGIC, self.VERSION))
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists("%s.%d" % (self.path, i)):
+                os.replace("%s.%d" % (self.path, i), "%s.%d" % (self.path, i + 1))
+        if self.backups:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if self.error is not None:
+                continue
+            try:
+                if self._file is None:
+                    if os.path.exists(self.path):
+                        self._rotate()
+                    self._open()
+                for item in batch:
+                    try:
+                        record = self._pack(*item)
+                    except (KeyError, struct.error):
+                        continue  # missing or out-of-range fields: skip the event, keep the log
+                    if self._size + len(record) > self.max_bytes and self._size > self.PREFIX.size:
+                        self._file.close()
+                        self._rotate()
+                        self._open()
+                    self._size += self._file.write(record)
+                self._file.flush()
+            except OSError as exc:
+                self.error = exc
+        if self._file is not None:
+            self._file.close()
+
+
+class FrameTimes:
+    """Frame time totals between two "frames" telemetry events: the interval between frames and the busy part of it."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.busy = 0.0
+        self.busiest = 0.0
+
+    def add(self, dt, busy):
+        self.frames += 1
+        self.total += dt
+        self.busy += busy
+        if dt > self.longest:
+            self.longest = dt
+        if busy > self.busiest:
+            self.busiest = busy
+
+    def fields(self):
+        n = max(self.frames, 1)
+        return {"frames": self.frames, "mean_ms": self.total / n * 1000, "max_ms": self.longest * 1000,
+                "busy_mean_ms": self.busy / n * 1000, "busy_max_ms": self.busiest * 1000}
+
+
+def read_events(path, rotated=True):
+    """Yield (kind, time, fields) for every event in an EventLog file, lazily and oldest first.
+
+    With `rotated`, the backups path.N ... path.1 are read first. A record
+    cut short at the end of a file, as a crash leaves it, ends that file;
+    events of unknown codes are skipped.
+    """
+    paths = []
+    if rotated:
+        i = 1
+        while os.path.exists("%s.%d" % (path, i)):
+            paths.append("%s.%d" % (path, i))
+            i += 1
+        paths.reverse()
+    paths.append(path)
+    prefix = EventLog.PREFIX
+    record = EventLog.RECORD
+    for p in paths:
+        with open(p, "rb") as f:
+            data = f.read(prefix.size)
+            if len(data) < prefix.size:
+                continue
+            magic, version = prefix.unpack(data)
+            if magic != EventLog.MAGIC:
+                raise ValueError("%s is not an event log" % p)
+            if version != EventLog.VERSION:
+                raise ValueError("unsupported event log version %d in %s" % (version, p))
+            while True:
+                head = f.read(record.size)
+                if len(head) < record.size:
+                    break
+                length, code, t = record.unpack(head)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                spec = EventLog.CODES.get(code)
+                if spec is not None:
+                    kind, fmt, names = spec
+                    yield kind, t, dict(zip(names, fmt.unpack_from(payload)))
+
+
+def load_font(size):
+    """The HUD font at `size`, loaded from FONT_PATH."""
+    return pygame.font.Font(FONT_PATH, size)
+
+
+def main(seed=None, record=None, cols=COLS, rows=ROWS, profile=None, physics_hz=PHYSICS_HZ,
+         max_steps=MAX_PHYSICS_STEPS, autoplay=False, frames=None, events=None, idle=True):
+    """Run the interactive game on a cols x rows board. `record` saves the last session as a Replay on exit.
+
+    The session is stepped at a fixed `physics_hz`, up to `max_steps` steps
+    per frame, and the moving shot is drawn interpolated between steps.
+    With `autoplay`, a ShotPlanner takes every shot (attract mode).
+
+    F3 toggles the frame profiler and its overlay. `profile` (default: the
+    PROFILE_ENV variable) turns it on from the start and names the JSON
+    file written on exit; otherwise a run that used F3 writes
+    DEFAULT_PROFILE_PATH. The profile also records the startup time, from
+    importing this module to the first frame on screen. `frames` quits
+    after that many frames, for timing runs, and turns idle mode off.
+
+    `events` (default: the EVENTS_ENV variable) streams telemetry to an
+    EventLog at that path: a "session" event per game, the session's
+    "shot", "pop" and "level" events, and after every landing a "frames"
+    event with the frame times since the previous one.
+
+    With `idle`, frames where nothing animates (no shot in flight, no
+    particles, no level banner, not autoplaying, no profiler overlay) end
+    the fixed-rate loop: main() then blocks on the event queue for up to
+    IDLE_WAIT_MS at a time and draws again only for input that changes
+    the screen, so an idle game uses next to no CPU. Idle time is not
+    game time.
+    """
+    if pygame is None:
+        raise ImportError("the game needs pygame")
+    # Only the subsystems the game uses: pygame.init() would also bring up audio and joysticks.
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Bubble Shot — Levels & Credits")
+    clock = pygame.time.Clock()
+    font = load_font(HUD_FONT_SIZE)
+    bigfont = load_font(BANNER_FONT_SIZE)
+
+    atlas = BubbleAtlas(radii=(CELL_RADIUS, POP_FRAGMENT_RADIUS))
+    text = TextCache()
+    instructions = text.shadowed(font, "Click or SPACE to shoot. R = restart, P = pause, ESC = quit", UI_COLOR)
+    board = BoardLayer(screen, atlas)
+    aim = AimGuide()
+    profile = profile or os.environ.get(PROFILE_ENV)
+    profiler = FrameProfiler(enabled=bool(profile))
+    profile_font = load_font(PROFILE_FONT_SIZE)
+    show_profile = False
+    events = events or os.environ.get(EVENTS_ENV)
+    bus = log = None
+    if events:
+        bus = EventBus()
+        log = EventLog(events)
+        bus.subscribe(log.write)
+    frame_times = FrameTimes()
+
+    def new_session():
+        s = GameSession(seed=seed, cols=cols, rows=rows, events=bus)
+        s.profiler = profiler
+        if bus is not None:
+            bus.emit("session", seed=s.seed, cols=cols, rows=rows)
+        return s
+
+    session = new_session()
+    particles = ParticleSystem()
+    effects_rng = random.Random(session.seed)
+    timestep = FixedTimestep(1.0 / physics_hz, max_steps)
+    planner = ShotPlanner() if autoplay else None
+    running = True
+    paused = False
+    full_redraw = True
+    prev_rects = []
+    waiting = False
+
+    try:
+        while running:
+            profiler.begin_frame()
+            woke = waiting
+            if waiting:
+                pending = [pygame.event.wait(IDLE_WAIT_MS)]
+                pending.extend(pygame.event.get())
+                # Still capped at FPS, as a stream of input returns from wait() at once; the wait is not simulated.
+                clock.tick(FPS)
+                dt = 0.0
+            else:
+                dt = clock.tick(FPS) / 1000.0
+                pending = pygame.event.get()
+            frame_start = time.perf_counter()
+            profiler.mark("idle")
+            # While waiting, only input that can change the screen wakes the loop:
+            # the aim follows the mouse unless paused.
+            wake = not waiting
+            for event in pending:
+                if event.type == pygame.NOEVENT:
+                    continue
+                wake = wake or not (paused and event.type == pygame.MOUSEMOTION)
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.VIDEOEXPOSE:
+                    full_redraw = True
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif event.key == pygame.K_r:
+                        session = new_session()
+                        particles.clear()
+                        paused = False
+                    elif event.key == pygame.K_SPACE:
+                        if not paused:
+                            mx, my = pygame.mouse.get_pos()
+                            session.fire(aim_angle(mx, my))
+                    elif event.key == pygame.K_p:
+                        paused = not paused
+                    elif event.key == pygame.K_u:
+                        if not paused:
+                            session.undo_shot()
+                    elif event.key == pygame.K_y:
+                        if not paused:
+                            session.redo_shot()
+                    elif event.key == pygame.K_F3:
+                        show_profile = not show_profile
+                        profiler.enabled = show_profile or bool(profile)
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1 and not paused:
+                        mx, my = event.pos
+                        session.fire(aim_angle(mx, my))
+            if planner is not None and not paused and session.can_fire():
+                session.fire(planner.choose(session))
+            profiler.mark("events")
+            if not wake:
+                profiler.discard_frame()  # an empty wait, not a frame
+                continue
+
+            if not paused:
+                for _ in range(timestep.advance(dt)):
+                    if session.step(timestep.dt) is not None:
+                        particles.burst(session.layout, session.last_popped, effects_rng)
+                        particles.drop(session.layout, session.last_dropped, effects_rng)
+                        if bus is not None:
+                            bus.emit("frames", **frame_times.fields())
+                            frame_times.reset()
+                particles.update(dt, session.shooter_pos[1] - SHOOTER_Y + SCREEN_HEIGHT)
+            profiler.mark("update")
+            grid = session.grid
+            current_bubble = session.current_bubble
+            next_preview = session.next_preview
+            # Scroll so the shooter stays at SHOOTER_POS on screen; 0 unless the board is taller than the screen.
+            view_top = session.shooter_pos[1] - SHOOTER_Y
+
+            # Restore the cached scene under last frame's moving parts and under changed cells.
+            board_rects = board.sync(grid, view_top)
+            if full_redraw:
+                screen.blit(board.surface, (0, 0))
             else:
-                lose_msg_shadow = bigfont.render("GAME OVER. Press R to restart", True, (0, 0, 0))
-                lose_msg = bigfont.render("GAME OVER. Press R to restart", True, (220, 80, 80))
-            lx = SCREEN_WIDTH // 2 - lose_msg.get_width() // 2
-            ly = SCREEN_HEIGHT // 2 - 20
-            screen.blit(lose_msg_shadow, (lx + 2, ly + 2))
-            screen.blit(lose_msg, (lx, ly))
+                for rect in prev_rects + board_rects:
+                    screen.blit(board.surface, rect, rect)
+            rects = []
+            profiler.mark("board")
+
+            rects.extend(particles.draw(screen, atlas, view_top))
+            if paused:
+                rects.append(current_bubble.draw(screen, atlas, view_top))
+                rects.append(next_preview.draw(screen, atlas, view_top))
+                profiler.mark("sprites")
+                rects.append(text.blit_centered(screen, bigfont, "PAUSED", UI_COLOR, SCREEN_HEIGHT // 2 - bigfont.get_height() // 2))
+            else:
+                mx, my = pygame.mouse.get_pos()
+                angle = aim_angle(mx, my)
+                if session.can_fire():
+                    aim.update(session, angle, view_top)
+                    rects.extend(aim.draw(screen))
+
+                if current_bubble.moving:
+                    current_bubble.x, current_bubble.y = session.shot_position(timestep.alpha)
+                else:
+                    current_bubble.x = session.shooter_pos[0] + math.cos(angle) * SHOT_HOLD_DIST
+                    current_bubble.y = session.shooter_pos[1] + math.sin(angle) * SHOT_HOLD_DIST
+                rects.append(current_bubble.draw(screen, atlas, view_top))
+
+                preview_y = next_preview.y - view_top
+                rects.append(pygame.draw.circle(screen, (80, 80, 80), (next_preview.x, preview_y), next_preview.r + 4))
+                next_preview.draw(screen, atlas, view_top)
+                profiler.mark("sprites")
+                rects.append(text.blit_shadowed(screen, font, "Next", UI_COLOR, (next_preview.x - 20, preview_y + 28)))
+
+                rects.append(text.blit_shadowed(screen, font, f"Score: {grid.score}", UI_COLOR, (12, 12)))
+                rects.append(text.blit_shadowed(screen, font, f"Level: {session.level}", UI_COLOR, (200 + 12, 12)))
+                rects.append(text.blit_shadowed(screen, font, f"Target: {session.params['target']}", UI_COLOR, (320 + 12, 12)))
+                rects.append(text.blit_shadowed(screen, font, f"Credits: {session.credits}", UI_COLOR, (12, 38)))
+                rects.append(text.blit_shadowed(screen, font, f"Shots left: {session.shots_remaining}", UI_COLOR, (200 + 12, 38)))
+                rects.append(text.blit_shadowed(screen, font, f"U = undo ({UNDO_COST} credits), Y = redo", UI_COLOR, (320 + 12, 38)))
+                rects.append(screen.blit(instructions, (12, SCREEN_HEIGHT - 28)))
+
+                if session.level_banner_timer > 0:
+                    banner = f"LEVEL {session.level}! +{LEVEL_CREDIT_REWARD} credits"
+                    rects.append(text.blit_centered(screen, bigfont, banner, (200, 220, 20), SCREEN_HEIGHT // 2 - 20))
+
+                if session.game_over:
+                    if session.out_of_shots:
+                        message = "OUT OF SHOTS. Press R to restart"
+                    else:
+                        message = "GAME OVER. Press R to restart"
+                    rects.append(text.blit_centered(screen, bigfont, message, (220, 80, 80), SCREEN_HEIGHT // 2 - 20))
+
+            if show_profile:
+                overlay = profiler.overlay(profile_font)
+                rects.append(screen.blit(overlay, (SCREEN_WIDTH - overlay.get_width() - 8, 70)))
+            profiler.mark("hud")
+
+            if full_redraw:
+                pygame.display.flip()
+                full_redraw = False
+            else:
+                pygame.display.update(prev_rects + board_rects + rects)
+            prev_rects = rects
+            profiler.mark("flip")
+            if profiler.startup is None:
+                profiler.startup = time.perf_counter() - IMPORT_TIME
+            if woke:
+                # Most of a wake-up frame is the wait for input, and it simulates nothing:
+                # counted apart, so it skews neither the profile nor the "frames" means.
+                profiler.discard_frame()
+                profiler.wakeups += 1
+            else:
+                frame_times.add(dt, time.perf_counter() - frame_start)
+            if frames is not None:
+                frames -= 1
+                running = running and frames > 0
+            animating = not paused and (current_bubble.moving or len(particles) or session.level_banner_timer > 0)
+            # A frame budget counts drawn frames, so a timing run never waits for input that will not come.
+            waiting = idle and frames is None and not animating and planner is None and not show_profile
+    finally:
+        # Also after a crash or Ctrl-C: those are the sessions the replay, telemetry and profile matter most for.
+        try:
+            if record:
+                Replay.from_session(session).save(record)
+        finally:
+            if log is not None:
+                log.close()
+            profiler.end_frame()  # the last frame is counted too
+            if profiler.frames:
+                profiler.dump(profile or DEFAULT_PROFILE_PATH)
+            pygame.quit()
+
+
+def replay_command(args):
+    grid_class = BitboardGrid if args.bitboard else Grid
+    failures = 0
+    for path in args.replays:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ValueError) as exc:
+            failures += 1
+            print("FAIL %s: %s" % (path, exc))
+            continue
+        ok, session = play_replay(replay, grid_class=grid_class)
+        failures += not ok
+        print("%s %s: %d shots, score %d (recorded %d), level %d" % (
+            "OK  " if ok else "FAIL", path, len(replay.shots), session.grid.score, replay.final_score, session.level))
+    return 1 if failures else 0
 
-        pygame.display.flip()
 
-    pygame.quit()
+def events_command(args):
+    """Print an event log as JSON lines."""
+    for kind, t, fields in read_events(args.log, rotated=not args.no_rotated):
+        if args.kind and kind not in args.kind:
+            continue
+        print(json.dumps(dict(kind=kind, time=round(t, 3), **fields)))
+    return 0
+
+
+def board_size(text):
+    """argparse type for a COLSxROWS board size, e.g. 40x200."""
+    try:
+        cols, rows = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected COLSxROWS, e.g. 40x200, got %r" % text)
+    if cols < 2 or rows < 2 or cols > BoardLayout.MAX_COLS or rows > 0xFFFF:
+        raise argparse.ArgumentTypeError("board must be between 2x2 and %dx65535, got %r"
+                                         % (BoardLayout.MAX_COLS, text))
+    try:
+        BoardLayout.get(cols, rows)  # shared with the game through the cache; any size it rejects fails here
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+    return cols, rows
+
+
+def positive_int(text):
+    """argparse type for an integer of at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected an integer, got %r" % text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got %r" % text)
+    return value
+
+
+def seed_value(text):
+    """argparse type for a session seed, which replays store as an unsigned 64-bit number."""
+    try:
+        seed = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected an integer seed, got %r" % text)
+    if not 0 <= seed < 1 << 64:
+        raise argparse.ArgumentTypeError("seed must be between 0 and %d, got %r" % ((1 << 64) - 1, text))
+    return seed
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(prog="bubble_shot", description="Bubble Shot game and tools.")
+    parser.set_defaults(command="play", seed=None, record=None, board=(COLS, ROWS), profile=None,
+                        physics_hz=PHYSICS_HZ, max_steps=MAX_PHYSICS_STEPS, autoplay=False, frames=None, events=None, idle=True)
+    sub = parser.add_subparsers(dest="command")
+    play = sub.add_parser("play", help="play the game (default)")
+    play.add_argument("--seed", type=seed_value, help="seed for the session RNG (a restart reuses it)")
+    play.add_argument("--record", metavar="FILE", help="save the last session as a replay on exit")
+    play.add_argument("--profile", metavar="FILE",
+                      help="profile frame phases from the start and write them to FILE on exit (F3 toggles in game; "
+                           "default: $%s)" % PROFILE_ENV)
+    play.add_argument("--autoplay", action="store_true", help="let the search bot play (attract mode)")
+    play.add_argument("--physics-hz", type=positive_int, default=PHYSICS_HZ,
+                      help="fixed simulation rate in steps per second (default: %(default)s)")
+    play.add_argument("--max-steps", type=positive_int, default=MAX_PHYSICS_STEPS,
+                      help="most simulation steps per frame before the game slows down (default: %(default)s)")
+    play.add_argument("--board", type=board_size, default=(COLS, ROWS), metavar="COLSxROWS",
+                      help="board size (default %dx%d); tall boards scroll" % (COLS, ROWS))
+    play.add_argument("--frames", type=int, metavar="N", help="quit after N frames (e.g. to time startup)")
+    play.add_argument("--no-idle", dest="idle", action="store_false",
+                      help="keep drawing at full frame rate when nothing moves")
+    play.add_argument("--events", metavar="FILE",
+                      help="stream telemetry events to a rotating binary log (default: $%s)" % EVENTS_ENV)
+    rep = sub.add_parser("replay", help="re-simulate replays headlessly and check their outcome")
+    rep.add_argument("replays", nargs="+", metavar="FILE")
+    rep.add_argument("--bitboard", action="store_true", help="use the BitboardGrid backend")
+    sim = sub.add_parser("simulate", help="play seeded headless games in parallel and report per-level stats")
+    sim.add_argument("--games", type=int, default=1000)
+    sim.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    sim.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    sim.add_argument("--seed", type=seed_value, default=0, help="seed of the first game; game i uses seed + i")
+    sim.add_argument("--max-level", type=int, default=50, help="stop a game after clearing this level")
+    sim.add_argument("--shard-size", type=int, default=0, help="games per worker task (default: automatic)")
+    sim.add_argument("--out", metavar="FILE", help="per-level summary (.csv or .json), rewritten as shards finish")
+    sim.add_argument("--records", metavar="FILE", help="stream one row per game and level (.csv or .jsonl)")
+    sim.add_argument("--list-grid", action="store_true", help="use the list-based Grid instead of BitboardGrid")
+    sim.add_argument("--board", type=board_size, default=(COLS, ROWS), metavar="COLSxROWS",
+                     help="board size (default %dx%d)" % (COLS, ROWS))
+    ev = sub.add_parser("events", help="print a telemetry event log as JSON lines")
+    ev.add_argument("log", metavar="FILE")
+    ev.add_argument("--kind", action="append", choices=sorted(EventLog.KINDS),
+                    help="only events of this kind (repeatable)")
+    ev.add_argument("--no-rotated", action="store_true", help="skip the rotated backups FILE.1, FILE.2, ...")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        return replay_command(args)
+    if args.command == "simulate":
+        return simulate_command(args)
+    if args.command == "events":
+        return events_command(args)
+    main(seed=args.seed, record=args.record, cols=args.board[0], rows=args.board[1], profile=args.profile,
+         physics_hz=args.physics_hz, max_steps=args.max_steps, autoplay=args.autoplay, frames=args.frames,
+         events=args.events, idle=args.idle)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())